@@ -0,0 +1,219 @@
+"""
+Admission control: cost classes with their own concurrency caps and queues.
+
+Every request is put in a class before it runs. Cheap pages and heavy
+analytics are admitted through separate semaphores, so a burst of heavy
+questions can only occupy HEAVY_CONCURRENCY workers and cheap pages never
+queue behind them. When a class and its bounded queue are both full the
+request is shed at once with 503 and a Retry-After estimated from the
+class's recent latency.
+
+The cost of a request is estimated from
+  - the latency history (EWMA) of its route, or of the question for
+    /query-result/<n>, and
+  - EXPLAIN QUERY PLAN for custom SQL from /search: full scans are costed
+    at the scanned table's row count, nested scans multiply.
+"""
+import math
+import os
+import re
+import threading
+import time
+
+HEAVY_SECONDS = float(os.environ.get("OLYMPICS_HEAVY_SECONDS", 0.25))
+HEAVY_ROWS = int(os.environ.get("OLYMPICS_HEAVY_ROWS", 100_000))
+EWMA_ALPHA = 0.2
+
+# Seconds a queued request may wait for a slot before it is shed: short, so
+# a worker thread is not held for long only to answer 503 in the end
+QUEUE_TIMEOUT = float(os.environ.get("OLYMPICS_QUEUE_TIMEOUT", 1.0))
+
+# class -> (concurrent requests, queued requests, seconds a request may wait)
+CLASSES = {
+    "cheap": (int(os.environ.get("OLYMPICS_CHEAP_CONCURRENCY", 32)), 64, QUEUE_TIMEOUT),
+    "heavy": (int(os.environ.get("OLYMPICS_HEAVY_CONCURRENCY", 2)),
+              int(os.environ.get("OLYMPICS_HEAVY_QUEUE", 4)), QUEUE_TIMEOUT),
+}
+# Routes that are heavy whatever their history: long streamed responses
+ALWAYS_HEAVY = {"export_data"}
+
+# FROM/JOIN <table> [AS] [alias]: the plan names tables by their alias
+FROM_RE = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.I)
+NOT_ALIASES = {"ON", "WHERE", "JOIN", "LEFT", "INNER", "CROSS", "NATURAL", "USING",
+               "GROUP", "ORDER", "LIMIT", "HAVING", "UNION", "EXCEPT", "INTERSECT"}
+
+
+class CostClass:
+    """A semaphore plus a bounded count of requests waiting for it."""
+
+    def __init__(self, name, concurrency, queue, timeout):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.running = 0
+        self.waiting = 0
+        self.shed = 0
+        self.latency = 0.0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        """Take a slot, waiting in the queue if there is room. False = shed."""
+        if self.slots.acquire(blocking=False):
+            with self._lock:
+                self.running += 1
+            return True
+        with self._lock:
+            if self.waiting >= self.queue:
+                self.shed += 1
+                return False
+            self.waiting += 1
+        admitted = False
+        try:
+            admitted = self.slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                if admitted:
+                    self.running += 1
+                else:
+                    self.shed += 1
+        return admitted
+
+    def leave(self, seconds):
+        with self._lock:
+            self.running -= 1
+            self.latency += EWMA_ALPHA * (seconds - self.latency)
+        self.slots.release()
+
+    def retry_after(self):
+        """Seconds until the queue ahead has likely drained."""
+        backlog = (self.waiting + self.concurrency) / self.concurrency
+        return max(1, math.ceil(self.latency * backlog))
+
+
+class Latencies:
+    """EWMA of the duration of each cost key (route or question)."""
+
+    def __init__(self):
+        self._seconds = {}
+
+    def get(self, key):
+        return self._seconds.get(key)
+
+    def record(self, key, seconds):
+        previous = self._seconds.get(key)
+        self._seconds[key] = seconds if previous is None else previous + EWMA_ALPHA * (seconds - previous)
+
+    def snapshot(self):
+        return dict(self._seconds)
+
+
+def plan_cost(conn, sql, table_rows):
+    """Rows `sql` is estimated to touch, from its EXPLAIN QUERY PLAN."""
+    aliases = {}
+    for table, alias in FROM_RE.findall(sql):
+        table, alias = table.upper(), alias.upper()
+        aliases[table] = table
+        if alias and alias not in NOT_ALIASES:
+            aliases[alias] = table
+    largest = max(table_rows.values(), default=0)
+    scans, searches = [], 0
+    for *_, detail in conn.execute("EXPLAIN QUERY PLAN " + sql):
+        words = detail.split()
+        if words[0] == "SCAN" and words[1] != "CONSTANT":
+            # A CTE, subquery or unknown name is costed as the largest table
+            scans.append(table_rows.get(aliases.get(words[1].upper(), words[1].upper()), largest))
+        elif words[0] == "SEARCH":
+            searches += 1
+    cost = math.prod(scans) if len(scans) > 1 else sum(scans)
+    return cost + searches
+
+
+class Admission:
+    """Classifies requests and admits them through the per-class limits."""
+
+    def __init__(self, classes=CLASSES):
+        self.classes = {name: CostClass(name, *limits) for name, limits in classes.items()}
+        self.latencies = Latencies()
+
+    def classify(self, key, plan_rows=None):
+        """Cost class for a request with cost key `key` (None = not tracked)."""
+        if key is not None and key[1] in ALWAYS_HEAVY:
+            return "heavy"
+        if plan_rows is not None:
+            return "heavy" if plan_rows > HEAVY_ROWS else "cheap"
+        seconds = self.latencies.get(key)
+        if seconds is None:
+            # Questions are aggregate queries: heavy until measured otherwise
+            return "heavy" if key is not None and key[0] == "question" else "cheap"
+        return "heavy" if seconds > HEAVY_SECONDS else "cheap"
+
+    def stats(self):
+        return {
+            name: {"running": c.running, "waiting": c.waiting,
+                   "shed": c.shed, "latency": round(c.latency, 4)}
+            for name, c in self.classes.items()
+        }
+
+
+def init_app(app, table_rows, get_conn):
+    """
+    Register the admission hooks on `app`. `table_rows()` returns
+    {TABLE: row count} and `get_conn()` a connection context manager, for
+    plan costs.
+    """
+    from flask import g, request
+
+    admission = Admission()
+
+    def cost_key():
+        if request.endpoint in (None, "static"):
+            return None
+        if request.endpoint == "query_result":
+            return ("question", request.view_args["file_number"])
+        return ("route", request.endpoint)
+
+    def custom_sql_rows():
+        sql = (request.values.get("custom_sql") or "").strip()
+        if request.endpoint != "search" or not sql.lower().startswith("select"):
+            return None
+        try:
+            with get_conn() as conn:
+                return plan_cost(conn, sql, table_rows())
+        except Exception:
+            return None  # invalid SQL fails fast in the view
+
+    @app.before_request
+    def admit():
+        if not app.config.get("ADMISSION", True):
+            return None
+        key = cost_key()
+        if key is None:
+            return None
+        plan_rows = custom_sql_rows()
+        cost_class = admission.classes[admission.classify(key, plan_rows)]
+        if not cost_class.enter():
+            return (
+                f"Server busy ({cost_class.name} requests), retry later\n",
+                503,
+                {"Retry-After": str(cost_class.retry_after()),
+                 "Content-Type": "text/plain; charset=utf-8"},
+            )
+        g.admission = (cost_class, key, plan_rows is None, time.perf_counter())
+        return None
+
+    @app.teardown_request
+    def release(exc=None):
+        admitted = g.pop("admission", None)
+        if admitted is None:
+            return
+        cost_class, key, track, start = admitted
+        seconds = time.perf_counter() - start
+        if track:
+            admission.latencies.record(key, seconds)
+        cost_class.leave(seconds)
+
+    app.extensions["admission"] = admission
+    return admission
@@ -2,26 +2,106 @@ import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 
 import os
-import sqlite3
-from flask import Flask, render_template, request, url_for
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context, url_for
 
+import admission
+import batch
+import compression
 import db
+import export
+import profiling
+import question_registry
+import warmup
 
 
 APP = Flask(__name__)
 APP.url_map.strict_slashes = False
+compression.init_app(APP)
 
 # -------------------------
-# DB PATH
+# DB MODE
 # -------------------------
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "Olympics.db")
+# One of db.DB_MODES ("default", "immutable", "memory"); see db.py
+APP.config.setdefault("DB_MODE", db.DB_MODE)
+# Replay hot routes (warmup.py) at startup and after each new import
+APP.config.setdefault("WARMUP", os.environ.get("OLYMPICS_WARMUP", "1") == "1")
 
 
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """
+    Context manager for a pooled connection to the served database:
+    `with get_conn() as conn:`. Connections (and their prepared statements)
+    are reused across requests and closed when a new version is picked up.
+    """
+    return db.connection(APP.config["DB_MODE"])
+
+
+# Cost-based admission control (admission.py): cheap pages and heavy
+# questions / custom SQL get separate concurrency caps and queues, and
+# overflow is shed with 503 + Retry-After; disable with OLYMPICS_ADMISSION=0
+APP.config.setdefault("ADMISSION", os.environ.get("OLYMPICS_ADMISSION", "1") == "1")
+
+
+@db.cached_per_version
+def table_rows():
+    """Row count of every table, used to cost query plans."""
+    with get_conn() as conn:
+        tables = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%';")]
+        return {t.upper(): conn.execute(f'SELECT COUNT(*) FROM "{t}";').fetchone()[0] for t in tables}
+
+
+# On-demand request profiling (profiling.py): requests carrying this token in
+# an X-Profile header or ?profile= are sampled, as is a PROFILE_RATE share
+# of all requests; results are served under /_profile/
+APP.config.setdefault("PROFILE_TOKEN", os.environ.get("OLYMPICS_PROFILE_TOKEN"))
+APP.config.setdefault("PROFILE_RATE", float(os.environ.get("OLYMPICS_PROFILE_RATE", 0)))
+profiling.init_app(APP)
+admission.init_app(APP, table_rows, get_conn)
+
+
+# With OLYMPICS_SNAPSHOT=1 the in-memory structures (graph, columnar engine,
+# facet and fuzzy indexes) are attached from a memory-mapped snapshot next to
+# Olympics.db (snapshot.py) instead of being built in every worker; until it
+# exists, pages fall back to SQL
+APP.config.setdefault("SNAPSHOT", os.environ.get("OLYMPICS_SNAPSHOT") == "1")
+
+
+def optional_structure(flag, env, name, build, variant=None):
+    """
+    Accessor for an optional in-memory structure: enabled by APP.config[flag]
+    (default: `env`=1), built by build() once per DB version, or attached from
+    snapshot `name` with SNAPSHOT on. `variant()` (e.g. the question digest)
+    is part of both keys. The accessor returns None when the structure is
+    disabled or its snapshot is not built yet.
+    """
+    APP.config.setdefault(flag, os.environ.get(env) == "1")
+
+    @db.cached_per_version
+    def load(variant_key):
+        return build()
+
+    def accessor():
+        if not APP.config[flag]:
+            return None
+        variant_key = variant() if variant else None
+        if APP.config["SNAPSHOT"]:
+            import snapshot
+            return snapshot.get(f"{name}-{variant_key}" if variant_key else name, build)
+        return load(variant_key)
+
+    return accessor
+
+
+# Optional in-process entity graph (graph.py) serving the detail pages
+# without SQL; enable with OLYMPICS_GRAPH=1 (needs NumPy)
+def build_entity_graph():
+    import graph
+    with get_conn() as conn:
+        return graph.EntityGraph(conn)
+
+
+entity_graph = optional_structure("ENTITY_GRAPH", "OLYMPICS_GRAPH", "graph", build_entity_graph)
 
 
 def link(endpoint, pk_name, pk_value, label=None):
@@ -40,17 +120,24 @@ def index():
 
 @APP.before_request
 def ensure_db_connected():
-    # Keep DB connection alive for request handlers
+    # Keep DB connection alive for request handlers, and pick up a newly
+    # published database (db_create.py) without restarting the server
     if 'conn' not in db.DB:
-        db.connect()
+        db.connect(APP.config["DB_MODE"])
+    else:
+        db.refresh_if_stale()
 
 
-@APP.context_processor
-def inject_sidebar_data():
-    """
-    Provide sidebar menu data: table counts and links.
-    Keeps the left pane static while the right pane swaps content.
-    """
+@db.on_new_version
+def warm_new_version(version):
+    # A fresh import was just picked up: replay hot routes in the background
+    if APP.config["WARMUP"]:
+        warmup.start(APP)
+
+
+@db.cached_per_version
+def sidebar_counts():
+    """Record counts per table; recomputed only when the DB version changes."""
     tables = [
         ("athletes_list", "ATHLETE", "ATHLETE"),
         ("teams_list", "TEAM", "TEAM"),
@@ -59,18 +146,28 @@ def inject_sidebar_data():
         ("events_list", "EVENT", "EVENT"),
     ]
     counts = []
+    with get_conn() as conn:
+        for endpoint, table, label in tables:
+            total = conn.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+            counts.append(
+                {
+                    "endpoint": endpoint,
+                    "label": label,
+                    "table": table,
+                    "count": total,
+                }
+            )
+    return counts
+
+
+@APP.context_processor
+def inject_sidebar_data():
+    """
+    Provide sidebar menu data: table counts and links.
+    Keeps the left pane static while the right pane swaps content.
+    """
     try:
-        with get_conn() as conn:
-            for endpoint, table, label in tables:
-                total = conn.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
-                counts.append(
-                    {
-                        "endpoint": endpoint,
-                        "label": label,
-                        "table": table,
-                        "count": total,
-                    }
-                )
+        counts = sidebar_counts()
     except Exception:
         # If DB is unavailable, keep sidebar empty rather than breaking the page
         counts = []
@@ -113,44 +210,50 @@ def athletes_list():
 
 @APP.route('/athletes/<int:athlete_id>/')
 def athlete_detail(athlete_id):
-    with get_conn() as conn:
-        record = conn.execute(
-            "SELECT * FROM ATHLETE WHERE athlete_id = ?;",
-            (athlete_id,)
-        ).fetchone()
-
-        teams = conn.execute(
-            """
-            SELECT t.team_id, t.name, t.noc
-            FROM IN_THE_TEAM it
-            JOIN TEAM t ON t.team_id = it.team_id
-            WHERE it.athlete_id = ?
-            ORDER BY t.name;
-            """,
-            (athlete_id,)
-        ).fetchall()
-
-        participations = conn.execute(
-            """
-            SELECT
-                e.event_id,
-                e.name AS event_name,
-                s.sport_id,
-                s.name AS sport,
-                o.year,
-                o.season,
-                o.city,
-                o.olympics_id,
-                pi.medal
-            FROM PARTICIPATED_IN pi
-            JOIN EVENT e      ON e.event_id = pi.event_id
-            JOIN SPORT s      ON s.sport_id = e.sport_id
-            JOIN OLYMPICS o   ON o.olympics_id = e.olympics_id
-            WHERE pi.athlete_id = ?
-            ORDER BY o.year, s.name, e.name;
-            """,
-            (athlete_id,)
-        ).fetchall()
+    graph = entity_graph()
+    if graph:
+        record = graph.athlete(athlete_id)
+        teams = graph.athlete_teams(athlete_id)
+        participations = graph.athlete_participations(athlete_id)
+    else:
+        with get_conn() as conn:
+            record = conn.execute(
+                "SELECT * FROM ATHLETE WHERE athlete_id = ?;",
+                (athlete_id,)
+            ).fetchone()
+
+            teams = conn.execute(
+                """
+                SELECT t.team_id, t.name, t.noc
+                FROM IN_THE_TEAM it
+                JOIN TEAM t ON t.team_id = it.team_id
+                WHERE it.athlete_id = ?
+                ORDER BY t.name;
+                """,
+                (athlete_id,)
+            ).fetchall()
+
+            participations = conn.execute(
+                """
+                SELECT
+                    e.event_id,
+                    e.name AS event_name,
+                    s.sport_id,
+                    s.name AS sport,
+                    o.year,
+                    o.season,
+                    o.city,
+                    o.olympics_id,
+                    pi.medal
+                FROM PARTICIPATED_IN pi
+                JOIN EVENT e      ON e.event_id = pi.event_id
+                JOIN SPORT s      ON s.sport_id = e.sport_id
+                JOIN OLYMPICS o   ON o.olympics_id = e.olympics_id
+                WHERE pi.athlete_id = ?
+                ORDER BY o.year, s.name, e.name;
+                """,
+                (athlete_id,)
+            ).fetchall()
 
     teams_rows = [
         {
@@ -220,34 +323,39 @@ def teams_list():
 
 @APP.route('/teams/<int:team_id>/')
 def team_detail(team_id):
-    with get_conn() as conn:
-        record = conn.execute(
-            "SELECT * FROM TEAM WHERE team_id = ?;",
-            (team_id,)
-        ).fetchone()
-
-        athletes = conn.execute(
-            """
-            SELECT a.athlete_id, a.name, a.sex
-            FROM IN_THE_TEAM it
-            JOIN ATHLETE a ON a.athlete_id = it.athlete_id
-            WHERE it.team_id = ?
-            ORDER BY a.name;
-            """,
-            (team_id,)
-        ).fetchall()
-
-        medal_breakdown = conn.execute(
-            """
-            SELECT COALESCE(pi.medal, 'No medal') AS medal, COUNT(*) AS count
-            FROM PARTICIPATED_IN pi
-            JOIN IN_THE_TEAM it ON it.athlete_id = pi.athlete_id
-            WHERE it.team_id = ?
-            GROUP BY medal
-            ORDER BY count DESC;
-            """,
-            (team_id,)
-        ).fetchall()
+    graph = entity_graph()
+    if graph:
+        record = graph.team(team_id)
+        athletes = graph.team_athletes(team_id)
+        medal_breakdown = graph.team_medals(team_id)
+    else:
+        with get_conn() as conn:
+            record = conn.execute(
+                "SELECT * FROM TEAM WHERE team_id = ?;",
+                (team_id,)
+            ).fetchone()
+
+            athletes = conn.execute(
+                """
+                SELECT a.athlete_id, a.name, a.sex
+                FROM IN_THE_TEAM it
+                JOIN ATHLETE a ON a.athlete_id = it.athlete_id
+                WHERE it.team_id = ?
+                ORDER BY a.name;
+                """,
+                (team_id,)
+            ).fetchall()
+
+            medal_breakdown = conn.execute(
+                """
+                SELECT COALESCE(pi.medal, 'No medal') AS medal, COUNT(*) AS count
+                FROM PARTICIPATED_IN pi
+                WHERE pi.team_id = ?
+                GROUP BY medal
+                ORDER BY count DESC;
+                """,
+                (team_id,)
+            ).fetchall()
 
     athlete_rows = [
         {
@@ -302,22 +410,27 @@ def sports_list():
 
 @APP.route('/sports/<int:sport_id>/')
 def sport_detail(sport_id):
-    with get_conn() as conn:
-        record = conn.execute(
-            "SELECT * FROM SPORT WHERE sport_id = ?;",
-            (sport_id,)
-        ).fetchone()
-
-        events = conn.execute(
-            """
-            SELECT e.event_id, e.name AS event_name, o.year, o.season, o.city, o.olympics_id
-            FROM EVENT e
-            JOIN OLYMPICS o ON o.olympics_id = e.olympics_id
-            WHERE e.sport_id = ?
-            ORDER BY o.year, e.name;
-            """,
-            (sport_id,)
-        ).fetchall()
+    graph = entity_graph()
+    if graph:
+        record = graph.sport(sport_id)
+        events = graph.sport_events(sport_id)
+    else:
+        with get_conn() as conn:
+            record = conn.execute(
+                "SELECT * FROM SPORT WHERE sport_id = ?;",
+                (sport_id,)
+            ).fetchone()
+
+            events = conn.execute(
+                """
+                SELECT e.event_id, e.name AS event_name, o.year, o.season, o.city, o.olympics_id
+                FROM EVENT e
+                JOIN OLYMPICS o ON o.olympics_id = e.olympics_id
+                WHERE e.sport_id = ?
+                ORDER BY o.year, e.name;
+                """,
+                (sport_id,)
+            ).fetchall()
 
     event_rows = [
         {
@@ -375,22 +488,28 @@ def olympics_list():
 
 @APP.route('/olympics/<int:olympics_id>/')
 def olympics_detail(olympics_id):
-    with get_conn() as conn:
-        record = conn.execute(
-            "SELECT * FROM OLYMPICS WHERE olympics_id = ?;",
-            (olympics_id,)
-        ).fetchone()
-
-        events = conn.execute(
-            """
-            SELECT e.event_id, e.name AS event_name, s.sport_id, s.name AS sport
-            FROM EVENT e
-            JOIN SPORT s ON s.sport_id = e.sport_id
-            WHERE e.olympics_id = ?
-            ORDER BY s.name, e.name;
-            """,
-            (olympics_id,)
-        ).fetchall()
+    graph = entity_graph()
+    if graph:
+        record = graph.olympics_record(olympics_id)
+        events = graph.olympics_events(olympics_id)
+    else:
+        # Only this Games' shard (plus the dimension tables) is read when sharded
+        with shard_conn(olympics_id) as conn:
+            record = conn.execute(
+                "SELECT * FROM OLYMPICS WHERE olympics_id = ?;",
+                (olympics_id,)
+            ).fetchone()
+
+            events = conn.execute(
+                """
+                SELECT e.event_id, e.name AS event_name, s.sport_id, s.name AS sport
+                FROM EVENT e
+                JOIN SPORT s ON s.sport_id = e.sport_id
+                WHERE e.olympics_id = ?
+                ORDER BY s.name, e.name;
+                """,
+                (olympics_id,)
+            ).fetchall()
 
     event_rows = [
         {
@@ -459,43 +578,47 @@ def events_list():
 
 @APP.route('/events/<int:event_id>/')
 def event_detail(event_id):
-    with get_conn() as conn:
-        record = conn.execute(
-            """
-            SELECT
-                e.event_id,
-                e.name AS event_name,
-                s.name AS sport,
-                o.name AS games_name,
-                o.year,
-                o.season,
-                o.city
-            FROM EVENT e
-            JOIN SPORT s ON s.sport_id = e.sport_id
-            JOIN OLYMPICS o ON o.olympics_id = e.olympics_id
-            WHERE e.event_id = ?;
-            """,
-            (event_id,)
-        ).fetchone()
-
-        medalists = conn.execute(
-            """
-            SELECT
-                a.athlete_id,
-                a.name AS athlete_name,
-                a.sex,
-                t.team_id,
-                t.name AS team,
-                pi.medal
-            FROM PARTICIPATED_IN pi
-            JOIN ATHLETE a ON a.athlete_id = pi.athlete_id
-            LEFT JOIN IN_THE_TEAM it ON it.athlete_id = a.athlete_id
-            LEFT JOIN TEAM t ON t.team_id = it.team_id
-            WHERE pi.event_id = ?
-            ORDER BY a.name;
-            """,
-            (event_id,)
-        ).fetchall()
+    graph = entity_graph()
+    if graph:
+        record = graph.event(event_id)
+        medalists = graph.event_medalists(event_id)
+    else:
+        with get_conn() as conn:
+            record = conn.execute(
+                """
+                SELECT
+                    e.event_id,
+                    e.name AS event_name,
+                    s.name AS sport,
+                    o.name AS games_name,
+                    o.year,
+                    o.season,
+                    o.city
+                FROM EVENT e
+                JOIN SPORT s ON s.sport_id = e.sport_id
+                JOIN OLYMPICS o ON o.olympics_id = e.olympics_id
+                WHERE e.event_id = ?;
+                """,
+                (event_id,)
+            ).fetchone()
+
+            medalists = conn.execute(
+                """
+                SELECT
+                    a.athlete_id,
+                    a.name AS athlete_name,
+                    a.sex,
+                    t.team_id,
+                    t.name AS team,
+                    pi.medal
+                FROM PARTICIPATED_IN pi
+                JOIN ATHLETE a ON a.athlete_id = pi.athlete_id
+                LEFT JOIN TEAM t ON t.team_id = pi.team_id
+                WHERE pi.event_id = ?
+                ORDER BY a.name;
+                """,
+                (event_id,)
+            ).fetchall()
 
     medalist_rows = [
         {
@@ -520,41 +643,119 @@ def event_detail(event_id):
 
 
 # =========================================================
-# QUERIES (files inside ./questions)
+# BATCH API
 # =========================================================
 
-QUESTION_TEXTS = {
-    1: 'Total number of athletes stored.',
-    2: 'Top 10 teams by medal count.',
-    3: 'How many events exist for each sport?',
-    4: 'Average athlete height and weight grouped by sex.',
-    5: 'Cities that have hosted the Olympics and how many times.',
-    6: 'Events with the largest number of medalists (top 10).',
-    7: 'Medal breakdown by sport (gold/silver/bronze).',
-    8: 'Athletes with the highest medal counts (top 10).',
-    9: 'Teams (NOC) that competed in the widest variety of sports (top 10).',
-    10: 'Olympic host cities ordered by number of events held.',
-    11: 'Average medalist age by sport (where age is known).',
-    12: 'Medalist counts per Olympic games (top 10).'
-}
+@APP.route('/api/<kind>', methods=['GET', 'POST'])
+def batch_lookup(kind):
+    """
+    Details of many athletes, teams or events at once:
+    GET /api/athletes?ids=1,2,3 or POST {"ids": [1, 2, 3]}.
+    """
+    if kind not in batch.KINDS:
+        return jsonify(error=f"unknown kind {kind!r}, expected one of {list(batch.KINDS)}"), 404
+    if request.method == 'POST':
+        payload = request.get_json(silent=True)
+        if payload is None:
+            payload = {}
+        if not isinstance(payload, dict):
+            return jsonify(error='request body must be a JSON object like {"ids": [1, 2, 3]}'), 400
+        values = payload.get('ids', [])
+    else:
+        values = request.args.get('ids', '')
+    try:
+        ids = batch.parse_ids(values)
+    except (TypeError, ValueError) as exc:
+        return jsonify(error=str(exc)), 400
+
+    with get_conn() as conn:
+        return jsonify(batch.lookup(conn, kind, ids))
+
+
+# =========================================================
+# QUERIES (files inside ./questions)
+# =========================================================
 
 SQL_FOLDER = os.path.join(os.path.dirname(__file__), 'questions')
 
+# Parsed once here; set OLYMPICS_QUESTIONS_WATCH=1 to reload on file changes
+QUESTIONS = question_registry.QuestionRegistry(SQL_FOLDER)
+APP.config.setdefault("QUESTIONS_WATCH", os.environ.get("OLYMPICS_QUESTIONS_WATCH") == "1")
+
+# Optional columnar engine (columnar.py) for the whole-table aggregate
+# questions; enable with OLYMPICS_COLUMNAR=1 (needs NumPy)
+def build_columnar_engine():
+    import columnar
+    with get_conn() as conn:
+        engine = columnar.ColumnarEngine(conn)
+        # Only questions whose results match SQLite exactly stay routed
+        engine.verify(conn, {n: QUESTIONS.get(n).sql for n in engine.queries if QUESTIONS.get(n)})
+    return engine
+
 
-def execute_query_from_file(file_number):
-    sql_file_path = os.path.join(SQL_FOLDER, f"{file_number}.sql")
+# The verified question set depends on the SQL, so its digest is part of the key
+columnar_engine = optional_structure(
+    "COLUMNAR", "OLYMPICS_COLUMNAR", "columnar", build_columnar_engine,
+    variant=lambda: QUESTIONS.digest[:12])
 
-    if not os.path.exists(sql_file_path):
+
+# Fan-out over the per-Games shards written by db_create.py --shard-by
+# (shards.py); used whenever the current version has shards unless
+# OLYMPICS_SHARDS=0
+APP.config.setdefault("SHARDS", os.environ.get("OLYMPICS_SHARDS", "1") == "1")
+
+
+@db.cached_per_version
+def load_sharded_engine(questions_generation):
+    import shards
+    layout = db.shard_layout()
+    if layout is None:
+        return None
+    engine = shards.ShardedEngine(layout, QUESTIONS, mode=APP.config["DB_MODE"])
+    with get_conn() as conn:
+        engine.verify(conn, {n: QUESTIONS.get(n).sql for n in engine.queries if QUESTIONS.get(n)})
+    return engine
+
+
+def sharded_engine():
+    """Return the ShardedEngine for the current DB version, or None."""
+    if not APP.config["SHARDS"]:
+        return None
+    return load_sharded_engine(QUESTIONS.generation)
+
+
+def shard_conn(olympics_id):
+    """
+    Context manager for a connection that reads one Games' shard (pooled,
+    see db.shard_connection), or the full database.
+    """
+    path = db.shard_for(olympics_id) if APP.config["SHARDS"] else None
+    return db.shard_connection(path, APP.config["DB_MODE"]) if path else get_conn()
+
+
+def execute_query_from_file(file_number, args=None):
+    question = QUESTIONS.get(file_number)
+
+    if question is None:
         return {"error": f"SQL file {file_number}.sql not found.", "query": "", "columns": [], "results": []}
 
-    query = ""
+    query = question.query
     try:
-        with open(sql_file_path, "r") as sql_file:
-            query = sql_file.read()
+        engine = columnar_engine()
+        if engine and engine.supports(file_number):
+            columns, results = engine.run(file_number)
+            return {"error": None, "query": query, "columns": columns, "results": results}
 
-        cursor = db.execute(query)
-        results = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description] if cursor.description else []
+        engine = sharded_engine()
+        if engine and engine.supports(file_number):
+            columns, results = engine.run(file_number)
+            return {"error": None, "query": query, "columns": columns, "results": results}
+
+        # Own connection: the shared cursor is not safe across request threads
+        with get_conn() as conn:
+            cursor = db.execute(question.sql, question.bind(args or {}), conn=conn)
+            results = cursor.fetchall()
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
 
         return {"error": None, "query": query, "columns": columns, "results": results}
 
@@ -564,29 +765,79 @@ def execute_query_from_file(file_number):
 
 @APP.route('/questions')
 def questions():
-    sql_files = sorted(
-        [f for f in os.listdir(SQL_FOLDER) if f.endswith('.sql')],
-        key=lambda x: int(x.split('.')[0])
-    )
-
-    questions = []
-    for f in sql_files:
-        num = int(f.split('.')[0])
-        questions.append({
-            "num": num,
-            "filename": f,
-            "text": QUESTION_TEXTS.get(num, "Question without description")
-        })
+    questions = [
+        {"num": q.number, "filename": q.filename, "text": q.title}
+        for q in QUESTIONS.all()
+    ]
 
     return render_template('questions.html', questions=questions)
 
 
 @APP.route('/query-result/<int:file_number>')
 def query_result(file_number):
-    data = execute_query_from_file(file_number)
+    data = execute_query_from_file(file_number, request.args)
     return render_template('query_result.html', file_number=file_number, **data)
 
 
+@APP.route('/export/<name>.<fmt>')
+def export_data(name, fmt):
+    """Stream a table (e.g. /export/ATHLETE.csv) or question (/export/q7.parquet)."""
+    # Its own connection: it is held until the last chunk is sent
+    conn = db.open_connection(APP.config["DB_MODE"])
+    try:
+        chunks = export.stream(name, fmt, conn=conn, questions=QUESTIONS)
+    except ValueError as exc:
+        conn.close()
+        return str(exc), 404, {"Content-Type": "text/plain; charset=utf-8"}
+
+    response = Response(
+        stream_with_context(chunks),
+        mimetype=export.FORMATS[fmt][1],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+    # Streamed after the view returns: closed once the last chunk is sent
+    response.call_on_close(conn.close)
+    return response
+
+
+# Typo-tolerant name search (fuzzy.py): trigram postings over athlete and
+# team names; enable with OLYMPICS_FUZZY=1 (needs NumPy). Without the index
+# the fuzzy filters match every word with LIKE
+FUZZY_FILTERS = {"athletes_fuzzy": "athletes", "teams_fuzzy": "teams"}
+
+
+def build_fuzzy_index():
+    import fuzzy
+    with get_conn() as conn:
+        return fuzzy.build(conn)
+
+
+# {kind: FuzzyIndex}
+fuzzy_index = optional_structure("FUZZY", "OLYMPICS_FUZZY", "fuzzy", build_fuzzy_index)
+
+
+def fuzzy_names(conn, kind, term):
+    """
+    (columns, rows, typo_tolerant) of the athletes or teams whose name is
+    close to term; typo_tolerant is False when the index is not loaded and
+    the rows come from the LIKE fallback.
+    """
+    pk = "athlete_id" if kind == "athletes" else "team_id"
+    indexes = fuzzy_index()
+    if indexes is not None:
+        matches = indexes[kind].search(term)
+        return [pk, "name", "distance"], [
+            {pk: i, "name": name, "distance": distance} for i, name, distance in matches], True
+    table = "ATHLETE" if kind == "athletes" else "TEAM"
+    words = term.split()
+    rows = conn.execute(
+        f"SELECT {pk}, name FROM {table} WHERE {' AND '.join('name LIKE ?' for _ in words)} "
+        f"ORDER BY name LIMIT 20;",
+        [f"%{w}%" for w in words],
+    ).fetchall()
+    return [pk, "name"], rows, False
+
+
 @APP.route('/search', methods=['GET', 'POST'])
 def search():
     """
@@ -596,7 +847,7 @@ def search():
     term = (request.values.get('term') or '').strip()
     custom_sql = request.values.get('custom_sql', '').strip()
 
-    filter_result = {"columns": [], "rows": [], "error": None}
+    filter_result = {"columns": [], "rows": [], "error": None, "note": None}
     custom_result = {"columns": [], "rows": [], "error": None, "query": custom_sql}
 
     if filter_type and term:
@@ -643,6 +894,14 @@ def search():
                         """,
                         (term,),
                     )
+                elif filter_type in FUZZY_FILTERS:
+                    cursor = None
+                    filter_result["columns"], filter_result["rows"], typo_tolerant = fuzzy_names(
+                        conn, FUZZY_FILTERS[filter_type], term)
+                    if not typo_tolerant:
+                        filter_result["note"] = (
+                            "The typo-tolerant index is not loaded: these names contain "
+                            "every word as typed (exact match).")
                 else:
                     cursor = None
 
@@ -658,10 +917,11 @@ def search():
             normalized = custom_sql.strip().lower()
             if not normalized.startswith("select"):
                 raise ValueError("Only SELECT queries are allowed.")
-            cursor = db.execute(custom_sql)
-            rows = cursor.fetchall()
-            custom_result["columns"] = [c[0] for c in cursor.description] if cursor.description else []
-            custom_result["rows"] = rows
+            with get_conn() as conn:
+                cursor = db.execute(custom_sql, conn=conn)
+                rows = cursor.fetchall()
+                custom_result["columns"] = [c[0] for c in cursor.description] if cursor.description else []
+                custom_result["rows"] = rows
         except Exception as exc:
             custom_result["error"] = str(exc)
 
@@ -672,4 +932,73 @@ def search():
         filter_type=filter_type or '',
         term=term,
         custom_sql=custom_sql,
+        fuzzy_enabled=APP.config["FUZZY"],
+    )
+
+
+# =========================================================
+# FACETED SEARCH
+# =========================================================
+
+# Bitmap indexes over the participations for /search/facets (facets.py);
+# enable with OLYMPICS_FACETS=1 (needs NumPy), otherwise counts come from SQL
+def build_facet_index():
+    import facets
+    with get_conn() as conn:
+        index = facets.FacetIndex(conn)
+        # A mismatch is logged by verify(); keep serving through SQL
+        return index if index.verify(conn) else None
+
+
+facet_index = optional_structure("FACETS", "OLYMPICS_FACETS", "facets", build_facet_index)
+
+
+@APP.route('/search/facets')
+def facet_search():
+    """
+    Participations filtered by any combination of sex, sport, season, year
+    range, NOC and medal, with the live count of every facet value.
+    """
+    import facets
+
+    try:
+        filters = facets.parse_filters(request.args)
+        page = max(1, request.args.get('page', 1, type=int))
+    except ValueError as exc:
+        filters, page, error = {}, 1, str(exc)
+    else:
+        error = None
+
+    offset = (page - 1) * facets.PAGE_SIZE
+    index = facet_index()
+    with get_conn() as conn:
+        if index is not None:
+            total, counts, rowids = index.search(filters, offset)
+        else:
+            total, counts, rowids = facets.sql_search(conn, filters, offset)
+        rows = facets.participations(conn, rowids)
+
+    rows = [
+        {
+            "athlete": link('athlete_detail', 'athlete_id', r['athlete_id'], r['athlete_name']),
+            "sex": r['sex'],
+            "event": link('event_detail', 'event_id', r['event_id'], r['event_name']),
+            "sport": link('sport_detail', 'sport_id', r['sport_id'], r['sport']),
+            "year": r['year'],
+            "season": r['season'],
+            "noc": link('team_detail', 'team_id', r['team_id'], r['noc']) if r['team_id'] else None,
+            "medal": r['medal'],
+        }
+        for r in rows
+    ]
+
+    return render_template(
+        'facets.html',
+        facets=counts,
+        filters=filters,
+        total=total,
+        rows=rows,
+        page=page,
+        pages=max(1, -(-total // facets.PAGE_SIZE)),
+        error=error,
     )
@@ -0,0 +1,132 @@
+"""
+Batch lookups: details of many athletes, teams or events in one request.
+
+Each kind answers with a fixed number of set-based queries whatever the
+number of ids: the ids are passed once as a JSON array and joined through
+json_each(), instead of running the detail page's queries once per id.
+Related rows come back grouped under their entity, in the order the detail
+pages show them.
+"""
+import json
+import os
+
+# Most ids one request may ask for
+BATCH_LIMIT = int(os.environ.get("OLYMPICS_BATCH_LIMIT", 500))
+
+ATHLETE_SQL = {
+    "record": """
+        SELECT a.* FROM json_each(:ids) j
+        JOIN ATHLETE a ON a.athlete_id = j.value;
+        """,
+    "teams": """
+        SELECT it.athlete_id AS owner, t.team_id, t.name, t.noc
+        FROM json_each(:ids) j
+        JOIN IN_THE_TEAM it ON it.athlete_id = j.value
+        JOIN TEAM t ON t.team_id = it.team_id
+        ORDER BY owner, t.name;
+        """,
+    "participations": """
+        SELECT pi.athlete_id AS owner, e.event_id, e.name AS event_name,
+               s.sport_id, s.name AS sport, o.year, o.season, o.city,
+               o.olympics_id, pi.team_id, pi.medal
+        FROM json_each(:ids) j
+        JOIN PARTICIPATED_IN pi ON pi.athlete_id = j.value
+        JOIN EVENT e    ON e.event_id = pi.event_id
+        JOIN SPORT s    ON s.sport_id = e.sport_id
+        JOIN OLYMPICS o ON o.olympics_id = e.olympics_id
+        ORDER BY owner, o.year, s.name, e.name;
+        """,
+}
+
+TEAM_SQL = {
+    "record": """
+        SELECT t.* FROM json_each(:ids) j
+        JOIN TEAM t ON t.team_id = j.value;
+        """,
+    "athletes": """
+        SELECT it.team_id AS owner, a.athlete_id, a.name, a.sex
+        FROM json_each(:ids) j
+        JOIN IN_THE_TEAM it ON it.team_id = j.value
+        JOIN ATHLETE a ON a.athlete_id = it.athlete_id
+        ORDER BY owner, a.name;
+        """,
+    "medals": """
+        SELECT pi.team_id AS owner, COALESCE(pi.medal, 'No medal') AS medal, COUNT(*) AS count
+        FROM json_each(:ids) j
+        JOIN PARTICIPATED_IN pi ON pi.team_id = j.value
+        GROUP BY owner, medal
+        ORDER BY owner, count DESC;
+        """,
+}
+
+EVENT_SQL = {
+    "record": """
+        SELECT e.event_id, e.name AS event_name, s.name AS sport,
+               o.name AS games_name, o.year, o.season, o.city
+        FROM json_each(:ids) j
+        JOIN EVENT e    ON e.event_id = j.value
+        JOIN SPORT s    ON s.sport_id = e.sport_id
+        JOIN OLYMPICS o ON o.olympics_id = e.olympics_id;
+        """,
+    "medalists": """
+        SELECT pi.event_id AS owner, a.athlete_id, a.name AS athlete_name, a.sex,
+               t.team_id, t.name AS team, pi.medal
+        FROM json_each(:ids) j
+        JOIN PARTICIPATED_IN pi ON pi.event_id = j.value
+        JOIN ATHLETE a ON a.athlete_id = pi.athlete_id
+        LEFT JOIN TEAM t ON t.team_id = pi.team_id
+        ORDER BY owner, a.name;
+        """,
+}
+
+# kind -> (primary key, queries)
+KINDS = {
+    "athletes": ("athlete_id", ATHLETE_SQL),
+    "teams": ("team_id", TEAM_SQL),
+    "events": ("event_id", EVENT_SQL),
+}
+
+
+def parse_ids(values):
+    """
+    Distinct integer ids, in request order, from a list or a comma separated
+    string. Raises ValueError for non-integers or more than BATCH_LIMIT ids.
+    """
+    if isinstance(values, str):
+        values = [v for v in values.split(",") if v.strip()]
+    ids = []
+    for value in values:
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise ValueError(f"ids must be integers, got {value!r}")
+        try:
+            ids.append(int(value))
+        except ValueError:
+            raise ValueError(f"ids must be integers, got {value!r}") from None
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > BATCH_LIMIT:
+        raise ValueError(f"at most {BATCH_LIMIT} ids per request, got {len(ids)}")
+    return ids
+
+
+def lookup(conn, kind, ids):
+    """
+    Details of every id of `kind`: {"<kind>": [record + related lists],
+    "missing": [ids with no record]}. Runs len(queries) statements.
+    """
+    pk, queries = KINDS[kind]
+    args = {"ids": json.dumps(ids)}
+    found = {row[pk]: dict(row) for row in conn.execute(queries["record"], args)}
+    for related, sql in queries.items():
+        if related == "record":
+            continue
+        for record in found.values():
+            record[related] = []
+        for row in conn.execute(sql, args):
+            row = dict(row)
+            owner = row.pop("owner")
+            if owner in found:
+                found[owner][related].append(row)
+    return {
+        kind: [found[i] for i in ids if i in found],
+        "missing": [i for i in ids if i not in found],
+    }
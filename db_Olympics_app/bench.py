@@ -0,0 +1,517 @@
+#! /usr/bin/python3
+"""
+Small benchmarks for the Olympics app.
+
+Usage:
+  python bench.py [--db PATH] open [--rounds N]
+  python bench.py [--db PATH] scale FACTOR OUT
+  python bench.py [--db PATH] columnar [--rounds N]
+  python bench.py [--db PATH] compression [--mbit N]
+  python bench.py [--db PATH] shards [--workers 1,2,4,8] [--rounds N]
+  python bench.py [--db PATH] teams [--rounds N]
+  python bench.py [--db PATH] snapshot
+  python bench.py [--db PATH] batch [--size N] [--rounds N]
+  python bench.py [--db PATH] facets [--rounds N]
+  python bench.py [--db PATH] fuzzy [--queries N]
+  python bench.py [--db PATH] admission [--heavy N] [--cheap N] [--seconds S]
+  python bench.py [--db PATH] profile [--rounds N]
+"""
+import argparse
+import glob
+import os
+import shutil
+import sqlite3
+import time
+
+import db
+from question_registry import QuestionRegistry
+
+QUESTIONS_GLOB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions', '*.sql')
+
+
+def question_sql(filename):
+    """The SQL of questions/<filename>."""
+    with open(os.path.join(os.path.dirname(QUESTIONS_GLOB), filename)) as f:
+        return f.read()
+
+
+def timed(fn, rounds):
+    """Run fn() `rounds` times and return the best wall time in seconds."""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_open(args):
+    """Compare the DB serving modes on a request-shaped workload."""
+    queries = [question_sql(os.path.basename(f)) for f in sorted(glob.glob(QUESTIONS_GLOB))]
+    probe = db.open_connection("default")
+    athlete_ids = [r[0] for r in probe.execute(
+        "SELECT athlete_id FROM ATHLETE ORDER BY random() LIMIT 200;")]
+    probe.close()
+
+    def workload(mode):
+        # A new connection per simulated request: the open cost of each mode
+        # (app.get_conn() reuses pooled connections)
+        for athlete_id in athlete_ids:
+            conn = db.open_connection(mode)
+            conn.execute("SELECT * FROM ATHLETE WHERE athlete_id = ?;", (athlete_id,)).fetchone()
+            conn.execute(
+                """
+                SELECT e.name, o.year, pi.medal
+                FROM PARTICIPATED_IN pi
+                JOIN EVENT e    ON e.event_id = pi.event_id
+                JOIN OLYMPICS o ON o.olympics_id = e.olympics_id
+                WHERE pi.athlete_id = ?;
+                """,
+                (athlete_id,)
+            ).fetchall()
+            conn.close()
+        conn = db.open_connection(mode)
+        for query in queries:
+            conn.execute(query).fetchall()
+        conn.close()
+
+    baseline = None
+    for mode in db.DB_MODES:
+        workload(mode)  # warm the OS page cache / in-memory copy
+        seconds = timed(lambda: workload(mode), args.rounds)
+        baseline = baseline or seconds
+        print(f"{mode:<10} {seconds * 1000:9.1f} ms  x{baseline / seconds:.2f}")
+
+
+def bench_scale(args):
+    """Write a copy of the database with athletes and their facts repeated FACTOR times."""
+    if os.path.exists(args.out):
+        os.remove(args.out)
+    src = db.open_connection("default")
+    dst = sqlite3.connect(args.out)
+    src.backup(dst)
+    src.close()
+    step = dst.execute("SELECT MAX(athlete_id) FROM ATHLETE;").fetchone()[0]
+    for k in range(1, args.factor):
+        offset = (k * step, step)
+        dst.execute(
+            "INSERT INTO ATHLETE SELECT athlete_id + ?, name, sex, height, weight "
+            "FROM ATHLETE WHERE athlete_id <= ?;", offset)
+        dst.execute(
+            "INSERT INTO IN_THE_TEAM SELECT athlete_id + ?, team_id "
+            "FROM IN_THE_TEAM WHERE athlete_id <= ?;", offset)
+        dst.execute(
+            "INSERT INTO PARTICIPATED_IN(athlete_id, event_id, age, medal, team_id) "
+            "SELECT athlete_id + ?, event_id, age, medal, team_id "
+            "FROM PARTICIPATED_IN WHERE athlete_id <= ?;", offset)
+        dst.commit()
+    rows = dst.execute("SELECT COUNT(*) FROM PARTICIPATED_IN;").fetchone()[0]
+    dst.close()
+    print(f"{args.out}: {rows} participations")
+
+
+def bench_columnar(args):
+    """SQLite vs the columnar engine on the questions it supports."""
+    import columnar
+
+    conn = db.open_connection("default")
+    start = time.perf_counter()
+    engine = columnar.ColumnarEngine(conn)
+    print(f"columnar load {time.perf_counter() - start:.2f} s")
+    sql = {n: question_sql(f"{n}.sql") for n in engine.queries}
+    dropped = engine.verify(conn, sql)
+    if dropped:
+        print(f"results differ from SQLite for {dropped}")
+    for number in sorted(engine.queries):
+        sqlite_s = timed(lambda: conn.execute(sql[number]).fetchall(), args.rounds)
+        columnar_s = timed(lambda: engine.run(number), args.rounds)
+        print(f"{number:>2}.sql  sqlite {sqlite_s * 1000:9.1f} ms  "
+              f"columnar {columnar_s * 1000:8.1f} ms  x{sqlite_s / columnar_s:.0f}")
+
+
+def bench_compression(args):
+    """Bytes on the wire and estimated time to last byte, per encoding."""
+    from app import APP
+
+    client = APP.test_client()
+    link_bytes_per_s = args.mbit * 1e6 / 8
+    for path in ('/athletes/', '/events/', '/static/style.css'):
+        for encoding in ('identity', 'gzip', 'br'):
+            start = time.perf_counter()
+            response = client.get(path, headers={'Accept-Encoding': encoding})
+            size = len(response.data)
+            server_s = time.perf_counter() - start
+            ttlb = server_s + size / link_bytes_per_s
+            used = response.headers.get('Content-Encoding', 'identity')
+            print(f"{path:<18} {used:<9} {size / 1024:9.1f} KiB  "
+                  f"server {server_s * 1000:7.1f} ms  TTLB@{args.mbit:g}Mbit {ttlb * 1000:8.1f} ms")
+
+
+def bench_shards(args):
+    """SQLite on the whole file vs fan-out over the Games shards, per pool size."""
+    import shards
+
+    layout = db.shard_layout()
+    if layout is None:
+        print(f"no shards for {db.DB_FILE}; run python ../db_create.py --db {db.DB_FILE} --shards-only")
+        return
+    conn = db.open_connection("default")
+    questions = QuestionRegistry(os.path.dirname(QUESTIONS_GLOB))
+    engine = shards.ShardedEngine(layout, questions)
+    sql = {n: questions.get(n).sql for n in engine.queries}
+    dropped = engine.verify(conn, sql)
+    if dropped:
+        print(f"results differ from SQLite for {dropped}")
+    workers = [int(w) for w in args.workers.split(',')]
+    print(f"{len(layout['shards'])} shards by {layout['by']}, {os.cpu_count()} CPUs")
+    for number in sorted(engine.queries):
+        sqlite_s = timed(lambda: conn.execute(sql[number]).fetchall(), args.rounds)
+        line = f"{number:>2}.sql  sqlite {sqlite_s * 1000:8.1f} ms"
+        for w in workers:
+            shard_s = timed(lambda: engine.run(number, w), args.rounds)
+            line += f"  {w:>2}w {shard_s * 1000:8.1f} ms x{sqlite_s / shard_s:.2f}"
+        print(line)
+
+
+# name -> (through IN_THE_TEAM on athlete_id, through PARTICIPATED_IN.team_id)
+TEAM_QUERIES = {
+    'team medals': (
+        """SELECT COALESCE(pi.medal, 'No medal') AS medal, COUNT(*) AS count
+           FROM PARTICIPATED_IN pi JOIN IN_THE_TEAM it ON it.athlete_id = pi.athlete_id
+           WHERE it.team_id = ? GROUP BY medal ORDER BY count DESC;""",
+        """SELECT COALESCE(pi.medal, 'No medal') AS medal, COUNT(*) AS count
+           FROM PARTICIPATED_IN pi
+           WHERE pi.team_id = ? GROUP BY medal ORDER BY count DESC;""",
+    ),
+    'event medalists': (
+        """SELECT a.athlete_id, a.name, t.team_id, t.name, pi.medal
+           FROM PARTICIPATED_IN pi JOIN ATHLETE a ON a.athlete_id = pi.athlete_id
+           LEFT JOIN IN_THE_TEAM it ON it.athlete_id = a.athlete_id
+           LEFT JOIN TEAM t ON t.team_id = it.team_id
+           WHERE pi.event_id = ? ORDER BY a.name;""",
+        """SELECT a.athlete_id, a.name, t.team_id, t.name, pi.medal
+           FROM PARTICIPATED_IN pi JOIN ATHLETE a ON a.athlete_id = pi.athlete_id
+           LEFT JOIN TEAM t ON t.team_id = pi.team_id
+           WHERE pi.event_id = ? ORDER BY a.name;""",
+    ),
+    '2.sql': (
+        """SELECT t.team_id, t.name AS team_name, t.noc,
+                  SUM(CASE WHEN pi.medal IS NOT NULL AND pi.medal <> 'NA' THEN 1 ELSE 0 END) AS medals
+           FROM TEAM t JOIN IN_THE_TEAM it ON it.team_id = t.team_id
+           JOIN PARTICIPATED_IN pi ON pi.athlete_id = it.athlete_id
+           GROUP BY t.team_id, t.name, t.noc HAVING medals > 0
+           ORDER BY medals DESC, team_name LIMIT 10;""",
+        None,
+    ),
+    '9.sql': (
+        """SELECT t.noc, t.name AS team_name, COUNT(DISTINCT e.sport_id) AS sports_count
+           FROM TEAM t JOIN IN_THE_TEAM it ON it.team_id = t.team_id
+           JOIN PARTICIPATED_IN pi ON pi.athlete_id = it.athlete_id
+           JOIN EVENT e ON e.event_id = pi.event_id
+           GROUP BY t.noc, t.name ORDER BY sports_count DESC, team_name LIMIT 10;""",
+        None,
+    ),
+}
+
+
+def bench_teams(args):
+    """IN_THE_TEAM fan-out joins vs PARTICIPATED_IN.team_id, on multi-team athletes."""
+    conn = db.open_connection("default")
+    # Teams and events of the athletes who were on the most teams
+    multi = [r[0] for r in conn.execute(
+        "SELECT athlete_id FROM IN_THE_TEAM GROUP BY athlete_id "
+        "ORDER BY COUNT(*) DESC, athlete_id LIMIT 100;")]
+    marks = ", ".join("?" for _ in multi)
+    params = {
+        'team medals': [r[0] for r in conn.execute(
+            f"SELECT DISTINCT team_id FROM IN_THE_TEAM WHERE athlete_id IN ({marks});", multi)],
+        'event medalists': [r[0] for r in conn.execute(
+            f"SELECT DISTINCT event_id FROM PARTICIPATED_IN WHERE athlete_id IN ({marks});", multi)],
+    }
+    print(f"{len(multi)} athletes with the most teams "
+          f"(up to {conn.execute('SELECT MAX(n) FROM (SELECT COUNT(*) AS n FROM IN_THE_TEAM GROUP BY athlete_id);').fetchone()[0]})")
+    for name, (via_teams, via_column) in TEAM_QUERIES.items():
+        if via_column is None:
+            via_column = question_sql(name)
+        ids = params.get(name, [None])
+
+        def run(sql):
+            rows = 0
+            for i in ids:
+                rows += len(conn.execute(sql, () if i is None else (i,)).fetchall())
+            return rows
+
+        rows_before, rows_after = run(via_teams), run(via_column)
+        before = timed(lambda: run(via_teams), args.rounds) / len(ids)
+        after = timed(lambda: run(via_column), args.rounds) / len(ids)
+        print(f"{name:<16} IN_THE_TEAM {before * 1000:8.2f} ms  team_id {after * 1000:8.2f} ms  "
+              f"x{before / after:.1f}  rows {rows_before} -> {rows_after}")
+
+
+def bench_snapshot(args):
+    """Building the graph / columnar engine from SQLite vs attaching their snapshot."""
+    import columnar
+    import graph
+    import snapshot
+
+    version = db.current_version()
+    builders = {
+        'graph': graph.EntityGraph,
+        'columnar': columnar.ColumnarEngine,
+    }
+    for name, build in builders.items():
+        conn = db.open_connection("default")
+        start = time.perf_counter()
+        obj = build(conn)
+        built = time.perf_counter() - start
+        conn.close()
+        start = time.perf_counter()
+        folder = snapshot.write(obj, f"bench-{name}", version)
+        written = time.perf_counter() - start
+        size = sum(e.stat().st_size for e in os.scandir(folder))
+        del obj
+        attach = timed(lambda: snapshot.load(f"bench-{name}", version), 5)
+        print(f"{name:<9} build {built:7.2f} s  write {written:6.2f} s  "
+              f"attach {attach * 1000:6.1f} ms  ({size / 2**20:.1f} MiB on disk)")
+        shutil.rmtree(folder)
+    try:
+        os.rmdir(snapshot.snapshot_dir(version))
+    except OSError:  # the app's own snapshots are in there
+        pass
+
+
+def bench_batch(args):
+    """Per-entity cost: one detail request per id vs one /api/<kind> batch."""
+    import batch
+    from app import APP
+
+    client = APP.test_client()
+    conn = db.open_connection("default")
+    pages = {'athletes': 'athlete_detail', 'teams': 'team_detail', 'events': 'event_detail'}
+    for kind, (pk, _) in batch.KINDS.items():
+        table = {'athletes': 'ATHLETE', 'teams': 'TEAM', 'events': 'EVENT'}[kind]
+        ids = [r[0] for r in conn.execute(
+            f"SELECT {pk} FROM {table} ORDER BY random() LIMIT ?;", (args.size,))]
+        prefix = f"/{kind}/"
+        point_sql = timed(lambda: [batch.lookup(conn, kind, [i]) for i in ids], args.rounds)
+        batch_sql = timed(lambda: batch.lookup(conn, kind, ids), args.rounds)
+        point_http = timed(lambda: [client.get(f"{prefix}{i}/") for i in ids], args.rounds)
+        batch_http = timed(lambda: client.get(f"/api/{kind}?ids={','.join(map(str, ids))}"), args.rounds)
+        n = len(ids)
+        print(f"{kind:<9} {n} ids  SQL {point_sql / n * 1e6:7.0f} -> {batch_sql / n * 1e6:6.0f} us/id "
+              f"x{point_sql / batch_sql:4.1f}   HTTP ({pages[kind]} vs /api) "
+              f"{point_http / n * 1e6:7.0f} -> {batch_http / n * 1e6:6.0f} us/id x{point_http / batch_http:4.1f}")
+
+
+def bench_facets(args):
+    """Facet counts and first page: SQL GROUP BY vs the bitmap index."""
+    import facets
+    from werkzeug.datastructures import MultiDict
+
+    conn = db.open_connection("default")
+    start = time.perf_counter()
+    index = facets.FacetIndex(conn)
+    print(f"index: built in {time.perf_counter() - start:.2f} s, {index.nbytes / 2**20:.1f} MiB")
+    cases = {
+        "no filter": "",
+        "sex": "sex=F",
+        "sex+season+years": "sex=F&season=Summer&year_from=1960&year_to=2000",
+        "medal+2 sports": "medal=Gold&sport={0}&sport={1}",
+        "all six": "sex=M&season=Summer&year_from=1980&year_to=2016&medal=Gold&sport={0}&noc={2}",
+    }
+    sports = index.dimensions["sport"].values
+    noc = index.dimensions["noc"].values[0]
+    for label, query in cases.items():
+        query = query.format(sports[0], sports[1], noc)
+        filters = facets.parse_filters(MultiDict(
+            [pair.split("=", 1) for pair in query.split("&") if pair]))
+        sql = timed(lambda: facets.sql_search(conn, filters), args.rounds)
+        bitmap = timed(lambda: index.search(filters), args.rounds)
+        assert index.search(filters) == facets.sql_search(conn, filters), label
+        print(f"{label:<18} SQL {sql * 1000:8.1f} ms   bitmaps {bitmap * 1000:6.2f} ms   x{sql / bitmap:6.0f}")
+
+
+def bench_fuzzy(args):
+    """Fuzzy athlete search: latency and recall for names with random typos."""
+    import random
+    import fuzzy
+
+    conn = db.open_connection("default")
+    start = time.perf_counter()
+    index = fuzzy.FuzzyIndex.from_sql(conn, "athletes")
+    print(f"index: {len(index.ids)} names, built in {time.perf_counter() - start:.2f} s, "
+          f"{index.nbytes / 2**20:.1f} MiB")
+
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+
+    def typo(name):
+        i = rng.randrange(len(name))
+        edit = rng.choice(("insert", "delete", "replace", "swap"))
+        if edit == "insert":
+            return name[:i] + rng.choice(letters) + name[i:]
+        if edit == "delete":
+            return name[:i] + name[i + 1:]
+        if edit == "replace":
+            return name[:i] + rng.choice(letters) + name[i + 1:]
+        return name[:i] + name[i + 1:i + 2] + name[i:i + 1] + name[i + 2:]
+
+    picks = rng.sample(range(len(index.ids)), args.queries)
+    latencies, found = [], 0
+    for i in picks:
+        query = typo(index.names[i])
+        start = time.perf_counter()
+        matches = index.search(query)
+        latencies.append(time.perf_counter() - start)
+        # Found = the athlete or a namesake is listed, or the typo spelled
+        # another athlete's name exactly and that one comes first
+        found += any(m[0] == index.ids[i] or m[1] == index.names[i] for m in matches) or (
+            bool(matches) and matches[0][2] == 0)
+    latencies.sort()
+    print(f"{args.queries} queries with one typo: p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms, "
+          f"found in top {fuzzy.TOP_K}: {found / args.queries:.1%}")
+    like = timed(lambda: conn.execute(
+        "SELECT athlete_id, name FROM ATHLETE WHERE name LIKE ? ORDER BY name;",
+        (f"%{index.names[picks[0]]}%",)).fetchall(), 3)
+    print(f"for comparison, one LIKE '%name%' scan: {like * 1000:.2f} ms (no typo tolerance)")
+
+
+def bench_admission(args):
+    """Cheap page latency while heavy questions saturate the server, with and without admission."""
+    import random
+    import threading
+    from app import APP
+
+    conn = db.open_connection("default")
+    athletes = [r[0] for r in conn.execute("SELECT athlete_id FROM ATHLETE ORDER BY random() LIMIT 500;")]
+    heavy_paths = [f"/query-result/{n}" for n in (6, 7, 8, 9, 11)]
+
+    def run(enabled):
+        APP.config["ADMISSION"] = enabled
+        stop = threading.Event()
+        cheap, heavy = [], {"ok": 0, "shed": 0}
+
+        def heavy_loop():
+            client = APP.test_client()
+            while not stop.is_set():
+                response = client.get(random.choice(heavy_paths))
+                if response.status_code == 503:
+                    heavy["shed"] += 1
+                    stop.wait(int(response.headers["Retry-After"]))
+                else:
+                    heavy["ok"] += 1
+
+        def cheap_loop():
+            client = APP.test_client()
+            while not stop.is_set():
+                start = time.perf_counter()
+                client.get(f"/athletes/{random.choice(athletes)}/")
+                cheap.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=heavy_loop) for _ in range(args.heavy)]
+        threads += [threading.Thread(target=cheap_loop) for _ in range(args.cheap)]
+        for t in threads:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        cheap.sort()
+        p50, p99 = cheap[len(cheap) // 2], cheap[int(len(cheap) * 0.99)]
+        print(f"admission {'on ' if enabled else 'off'}  cheap: {len(cheap):5} requests "
+              f"p50 {p50 * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms   "
+              f"heavy: {heavy['ok']} served, {heavy['shed']} shed (503)")
+
+    for path in heavy_paths:  # seed the latency history
+        APP.test_client().get(path)
+    run(False)
+    run(True)
+
+
+def bench_profile(args):
+    """Sampling profiler: overhead per request, and where the time goes."""
+    import profiling
+    from app import APP
+
+    APP.config["PROFILE_TOKEN"] = "bench"
+    client = APP.test_client()
+    conn = db.open_connection("default")
+    athlete = conn.execute("SELECT athlete_id FROM ATHLETE ORDER BY random() LIMIT 1;").fetchone()[0]
+    paths = ["/events/", f"/athletes/{athlete}/", "/query-result/1", "/query-result/9"]
+    for path in paths:
+        client.get(path)  # warm the caches
+        plain = timed(lambda: client.get(path), args.rounds)
+        profiled = timed(lambda: client.get(path, headers={"X-Profile": "bench"}), args.rounds)
+        profile = profiling.get(client.get(path, headers={"X-Profile": "bench"}).headers["X-Profile-Id"])
+        breakdown = "  ".join(f"{b} {profile['breakdown'][b] * 1000:7.1f}" for b in profiling.BUCKETS)
+        print(f"{path:<22} {plain * 1000:8.1f} -> {profiled * 1000:8.1f} ms profiled "
+              f"({profile['samples']:5} samples)  {breakdown}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', help='database file (default: db.DB_FILE)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('open', help='default vs immutable/mmap vs in-memory open')
+    p.add_argument('--rounds', type=int, default=5)
+    p.set_defaults(func=bench_open)
+
+    p = sub.add_parser('scale', help='write a synthetic copy with FACTOR x the facts')
+    p.add_argument('factor', type=int)
+    p.add_argument('out')
+    p.set_defaults(func=bench_scale)
+
+    p = sub.add_parser('columnar', help='SQLite vs columnar engine for /questions')
+    p.add_argument('--rounds', type=int, default=3)
+    p.set_defaults(func=bench_columnar)
+
+    p = sub.add_parser('compression', help='response sizes and time to last byte per encoding')
+    p.add_argument('--mbit', type=float, default=10.0, help='client link speed')
+    p.set_defaults(func=bench_compression)
+
+    p = sub.add_parser('shards', help='SQLite vs fan-out over the shards, per pool size')
+    p.add_argument('--workers', default='1,2,4,8', help='comma separated pool sizes')
+    p.add_argument('--rounds', type=int, default=3)
+    p.set_defaults(func=bench_shards)
+
+    p = sub.add_parser('teams', help='IN_THE_TEAM joins vs PARTICIPATED_IN.team_id')
+    p.add_argument('--rounds', type=int, default=3)
+    p.set_defaults(func=bench_teams)
+
+    p = sub.add_parser('snapshot', help='build from SQLite vs attach the memory-mapped snapshot')
+    p.set_defaults(func=bench_snapshot)
+
+    p = sub.add_parser('batch', help='detail page per id vs one batch lookup')
+    p.add_argument('--size', type=int, default=200)
+    p.add_argument('--rounds', type=int, default=3)
+    p.set_defaults(func=bench_batch)
+
+    p = sub.add_parser('facets', help='faceted search: SQL GROUP BY vs bitmap index')
+    p.add_argument('--rounds', type=int, default=3)
+    p.set_defaults(func=bench_facets)
+
+    p = sub.add_parser('fuzzy', help='typo-tolerant athlete search: latency and recall')
+    p.add_argument('--queries', type=int, default=500)
+    p.set_defaults(func=bench_fuzzy)
+
+    p = sub.add_parser('admission', help='cheap page p99 under heavy load, admission off vs on')
+    p.add_argument('--heavy', type=int, default=8, help='threads requesting heavy questions')
+    p.add_argument('--cheap', type=int, default=4, help='threads requesting athlete pages')
+    p.add_argument('--seconds', type=float, default=20.0)
+    p.set_defaults(func=bench_admission)
+
+    p = sub.add_parser('profile', help='profiler overhead and per-bucket time of a few pages')
+    p.add_argument('--rounds', type=int, default=3)
+    p.set_defaults(func=bench_profile)
+
+    args = parser.parse_args()
+    if args.db:
+        db.DB_FILE = os.path.abspath(args.db)
+        db.VERSION_FILE = db.DB_FILE + ".version"
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
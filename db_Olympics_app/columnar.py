@@ -0,0 +1,197 @@
+"""
+Columnar engine for the whole-table aggregate questions.
+
+PARTICIPATED_IN and the dimension keys it joins through are loaded once
+into NumPy arrays; each supported question is a handful of vectorised
+group-bys (bincount / unique) instead of SQLite's row-at-a-time executor.
+Results are checked against SQLite when the engine is built and any
+question that does not match is left to SQLite.
+"""
+import logging
+import sqlite3
+
+import numpy as np
+
+from graph import load_table, sort_rank
+
+
+def sqlite_round(values, digits):
+    """ROUND(x, digits) exactly as SQLite computes it."""
+    conn = sqlite3.connect(":memory:")
+    try:
+        out = []
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            sql = "SELECT " + ", ".join(f"round(?, {digits})" for _ in chunk)
+            out.extend(conn.execute(sql, chunk).fetchone())
+        return out
+    finally:
+        conn.close()
+
+
+def fetch_int_columns(conn, sql, batch=100_000):
+    """Run an all-integer query into one int64 array, fetchmany() at a time."""
+    cursor = conn.execute(sql)
+    width = len(cursor.description)
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(batch)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.int64).reshape(-1, width))
+    return np.concatenate(chunks) if chunks else np.empty((0, width), dtype=np.int64)
+
+
+def _distinct(values):
+    """Sorted distinct values of an int array (sort + adjacent compare)."""
+    values = np.sort(values)
+    if len(values):
+        values = values[np.concatenate(([True], values[1:] != values[:-1]))]
+    return values
+
+
+def _order(*keys):
+    """Stable argsort by keys (first key is primary), like ORDER BY."""
+    return np.lexsort(tuple(reversed(keys)))
+
+
+class ColumnarEngine:
+    """PARTICIPATED_IN and its join keys as flat arrays."""
+
+    def __init__(self, conn):
+        self.sports = load_table(conn, "SPORT", "sport_id", [("name", str)])
+        self.olympics = load_table(conn, "OLYMPICS", "olympics_id", [
+            ("name", str), ("year", np.int32), ("season", str), ("city", str)])
+        self.teams = load_table(conn, "TEAM", "team_id", [("name", str), ("noc", str)])
+        events = fetch_int_columns(
+            conn, "SELECT event_id, sport_id, olympics_id FROM EVENT ORDER BY event_id;")
+        self.event_ids = events[:, 0]
+        self.event_sport = self.sports.indices(events[:, 1])
+        self.event_olympics = self.olympics.indices(events[:, 2])
+
+        # Medal codes: 0 = NULL, 1..3 = Gold/Silver/Bronze, 4 = 'NA', 5 = other
+        pi = fetch_int_columns(conn, """
+            SELECT athlete_id, event_id, COALESCE(age, -1),
+                   CASE WHEN medal IS NULL THEN 0 WHEN medal = 'Gold' THEN 1
+                        WHEN medal = 'Silver' THEN 2 WHEN medal = 'Bronze' THEN 3
+                        WHEN medal = 'NA' THEN 4 ELSE 5 END,
+                   COALESCE(team_id, -1)
+            FROM PARTICIPATED_IN;
+            """)
+        self.pi_athlete = pi[:, 0]
+        pi_event = np.searchsorted(self.event_ids, pi[:, 1])
+        self.pi_sport = self.event_sport[pi_event]
+        self.pi_olympics = self.event_olympics[pi_event]
+        self.pi_age = pi[:, 2]
+        self.pi_has_age = self.pi_age >= 0
+        medal = pi[:, 3]
+        self.pi_gold = medal == 1
+        self.pi_silver = medal == 2
+        self.pi_bronze = medal == 3
+        # medal IS NOT NULL AND medal <> 'NA'
+        self.pi_medal = (medal != 0) & (medal != 4)
+        # Team the participation was under, -1 when unknown
+        self.pi_team = np.where(pi[:, 4] >= 0, self.teams.indices(pi[:, 4]), -1)
+
+        self.queries = {7: self.q7, 9: self.q9, 11: self.q11, 12: self.q12}
+
+    def __getstate__(self):
+        # The routed questions are kept by number (see snapshot.py)
+        state = dict(vars(self))
+        state["queries"] = sorted(self.queries)
+        return state
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self.queries = {number: getattr(self, f"q{number}") for number in state["queries"]}
+
+    def supports(self, number):
+        return number in self.queries
+
+    def run(self, number):
+        """Return (columns, rows) for question `number`."""
+        return self.queries[number]()
+
+    def verify(self, conn, sql_by_number):
+        """
+        Compare every supported question with SQLite and drop the ones that
+        differ. Returns the list of question numbers that were dropped.
+        """
+        dropped = []
+        for number in list(self.queries):
+            if number not in sql_by_number:
+                # No question file: nothing to compare with or to serve
+                logging.warning(f"Question {number} has no SQL file; columnar engine skips it")
+                del self.queries[number]
+                continue
+            cursor = conn.execute(sql_by_number[number])
+            expected = ([d[0] for d in cursor.description], [tuple(r) for r in cursor.fetchall()])
+            if self.run(number) != expected:
+                logging.warning(f"Columnar result for question {number} differs from SQLite; disabled")
+                del self.queries[number]
+                dropped.append(number)
+        return dropped
+
+    # -------- questions --------
+    def q7(self):
+        """Medal breakdown by sport."""
+        n = len(self.sports)
+        golds = np.bincount(self.pi_sport, weights=self.pi_gold, minlength=n).astype(np.int64)
+        silvers = np.bincount(self.pi_sport, weights=self.pi_silver, minlength=n).astype(np.int64)
+        bronzes = np.bincount(self.pi_sport, weights=self.pi_bronze, minlength=n).astype(np.int64)
+        total = np.bincount(self.pi_sport, weights=self.pi_medal, minlength=n).astype(np.int64)
+        keep = np.flatnonzero(total > 0)
+        keep = keep[_order(-total[keep], sort_rank(self.sports.columns["name"])[keep])]
+        names = self.sports.columns["name"]
+        rows = [(names[s], int(golds[s]), int(silvers[s]), int(bronzes[s]), int(total[s])) for s in keep]
+        return ["sport", "golds", "silvers", "bronzes", "total_medals"], rows
+
+    def q9(self):
+        """Teams (by NOC and name) with the most distinct sports."""
+        n_sports = len(self.sports)
+        noc_rank = sort_rank(self.teams.columns["noc"])
+        name_rank = sort_rank(self.teams.columns["name"])
+        group_keys, team_group = np.unique(
+            np.stack([noc_rank, name_rank], axis=1), axis=0, return_inverse=True)
+        team_group = team_group.reshape(-1)
+        n_groups = len(group_keys)
+        # Distinct (team group, sport) pairs over participations with a team
+        has_team = self.pi_team >= 0
+        pi_group = team_group[self.pi_team[has_team]].astype(np.int64)
+        distinct = _distinct(pi_group * n_sports + self.pi_sport[has_team])
+        sports_count = np.bincount(distinct // n_sports, minlength=n_groups)
+        keep = np.flatnonzero(sports_count > 0)
+        keep = keep[_order(-sports_count[keep], group_keys[keep, 1], group_keys[keep, 0])][:10]
+        # Any team of the group carries its noc/name
+        representative = np.zeros(n_groups, dtype=np.int64)
+        representative[team_group] = np.arange(len(team_group))
+        teams = self.teams.columns
+        rows = [(teams["noc"][t], teams["name"][t], int(sports_count[g]))
+                for g, t in zip(keep, representative[keep])]
+        return ["noc", "team_name", "sports_count"], rows
+
+    def q11(self):
+        """Average age by sport where age is known."""
+        n = len(self.sports)
+        sport = self.pi_sport[self.pi_has_age]
+        count = np.bincount(sport, minlength=n)
+        total = np.bincount(sport, weights=self.pi_age[self.pi_has_age], minlength=n)
+        keep = np.flatnonzero(count > 0)
+        avg = np.zeros(n)
+        avg[keep] = sqlite_round((total[keep] / count[keep]).tolist(), 2)
+        keep = keep[_order(avg[keep], sort_rank(self.sports.columns["name"])[keep])]
+        names = self.sports.columns["name"]
+        rows = [(names[s], float(avg[s]), int(count[s])) for s in keep]
+        return ["sport", "avg_age", "medalists_with_age"], rows
+
+    def q12(self):
+        """Participation counts per Games (top 10)."""
+        n = len(self.olympics)
+        count = np.bincount(self.pi_olympics, minlength=n)
+        keep = np.flatnonzero(count > 0)
+        year = sort_rank(self.olympics.columns["year"])
+        keep = keep[_order(-count[keep], year[keep], keep)][:10]
+        games = self.olympics.columns
+        rows = [(int(self.olympics.ids[o]), games["name"][o], games["year"][o],
+                 games["season"][o], games["city"][o], int(count[o])) for o in keep]
+        return ["olympics_id", "games_name", "year", "season", "city", "medalists"], rows
@@ -0,0 +1,174 @@
+"""
+Negotiated gzip / brotli compression for responses.
+
+Dynamic pages are compressed in an after_request hook at a throughput
+oriented level; streamed responses (exports) are compressed chunk by chunk
+so they stay streamed. Files under static/ are compressed at maximum level
+at startup (again after a change) and served from memory, each encoding
+with its own ETag, so they cost no CPU and no file read per request.
+Brotli is used only when the `brotli` package is installed.
+"""
+import logging
+import mimetypes
+import os
+import threading
+import zlib
+
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+MIN_SIZE = 1024        # smaller bodies are not worth the header + CPU
+GZIP_LEVEL = 5         # dynamic responses: close to level 9 size, much faster
+BROTLI_QUALITY = 4
+COMPRESSIBLE = ("text/", "application/json", "application/x-ndjson",
+                "application/javascript", "image/svg+xml")
+STATIC_EXTENSIONS = (".css", ".js", ".html", ".svg", ".json", ".txt")
+
+
+def _gzip(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip container
+    return compressor.compress(data) + compressor.flush()
+
+
+def _encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(request):
+    """Best encoding the client accepts (brotli preferred), or None."""
+    best, best_q = None, 0
+    for encoding in _encodings():
+        q = request.accept_encodings[encoding]
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return _gzip(data, GZIP_LEVEL)
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of byte chunks, flushing after each chunk."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            out = compressor.process(chunk) + compressor.flush()
+            if out:
+                yield out
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if out:
+                yield out
+        yield compressor.flush()
+
+
+class StaticVariants:
+    """
+    Precompressed variants of the compressible files in a static folder,
+    {filename: (mtime_ns, size, {encoding: bytes})}. Every file is compressed
+    at startup; a file whose mtime or size has changed since is compressed
+    again on its next request.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.files = {}
+        self._lock = threading.Lock()
+        for root, _, files in os.walk(folder):
+            for name in files:
+                if name.endswith(STATIC_EXTENSIONS):
+                    self.get(os.path.relpath(os.path.join(root, name), folder).replace(os.sep, "/"))
+        logging.info(f"Precompressed {len(self.files)} static files")
+
+    def get(self, filename):
+        """(mtime_ns, size, {encoding: bytes}) of `filename`, or None if not compressible."""
+        path = safe_join(self.folder, filename)
+        if path is None or not filename.endswith(STATIC_EXTENSIONS):
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        entry = self.files.get(filename)
+        if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            return entry
+        with open(path, "rb") as f:
+            data = f.read()
+        variants = {"gzip": _gzip(data, 9)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(data, quality=11)
+        # The stat taken before reading: a write during the read shows up next time
+        entry = (stat.st_mtime_ns, stat.st_size,
+                 {enc: body for enc, body in variants.items() if len(body) < len(data)})
+        with self._lock:
+            self.files[filename] = entry
+        return entry
+
+
+def init_app(app):
+    """Precompress app.static_folder and register the compression hooks."""
+    from flask import request
+
+    static = StaticVariants(app.static_folder) if app.static_folder else None
+
+    @app.before_request
+    def serve_precompressed():
+        # Served from memory: Flask's static view would open the file again
+        if request.endpoint != "static" or static is None:
+            return None
+        encoding = choose_encoding(request)
+        filename = request.view_args.get("filename", "")
+        entry = static.get(filename) if encoding else None
+        if entry is None or encoding not in entry[2]:
+            return None
+        mtime_ns, size, variants = entry
+        body = variants[encoding]
+        response = app.response_class(
+            body, mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        # Each encoding is its own representation, with its own validator
+        response.set_etag(f"{mtime_ns:x}-{size:x}-{encoding}")
+        response.last_modified = mtime_ns // 1_000_000_000
+        max_age = app.get_send_file_max_age(filename)
+        if max_age:
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+        else:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(body))
+
+    @app.after_request
+    def compress_response(response):
+        if response.status_code != 200 or "Content-Encoding" in response.headers:
+            return response
+        if not response.mimetype.startswith(COMPRESSIBLE):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = choose_encoding(request)
+        if encoding is None or request.endpoint == "static":
+            # Static files not worth compressing are sent as they are
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < MIN_SIZE:
+                return response
+            response.set_data(compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    return compress_response
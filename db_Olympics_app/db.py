@@ -1,28 +1,371 @@
+import functools
+import json
 import logging
 import sqlite3
+import threading
+import time
 import re
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import quote
 
 DB = {}
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Use the Olympics database that ships with the APP folder
 DB_FILE = os.path.join(BASE_DIR, "Olympics.db")
+# The published version, written by db_create.py
+VERSION_FILE = DB_FILE + ".version"
+# db_create.py publishes each version as DB_FILE.data-<version> before it
+# flips VERSION_FILE, and relinks DB_FILE to it afterwards
+DATA_SUFFIX = ".data-"
 
-def connect():
-    global DB
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+# How the served database is opened. The web app never writes, so it can
+# skip SQLite's locking/journal checks:
+#   default   - plain sqlite3.connect(DB_FILE)
+#   immutable - read-only URI with immutable=1 and a large mmap window, so
+#               hot pages are read straight from the OS page cache
+#   memory    - the file is copied once (backup API) into a shared-cache
+#               in-memory database that every connection attaches to
+DB_MODES = ("default", "immutable", "memory")
+DB_MODE = os.environ.get("OLYMPICS_DB_MODE", "default")
+MMAP_SIZE = int(os.environ.get("OLYMPICS_MMAP_SIZE", 1 << 30))
+
+# Optional sharded copy of EVENT / PARTICIPATED_IN written by db_create.py:
+# one SQLite file per Games (or decade) in DB_FILE.shards-<version>/
+SHARDS_SUFFIX = ".shards-"
+# One worker was fastest on the only host measured (README, Sharded fact table)
+SHARD_WORKERS = int(os.environ.get("OLYMPICS_SHARD_WORKERS", 1))
+# Seconds between checks of the version pointer by watch_version(); 0 = only
+# on requests
+VERSION_POLL = float(os.environ.get("OLYMPICS_VERSION_POLL", 1.0))
+
+# A string literal or quoted name, kept as written, or else a run of
+# whitespace and comments, which compact_sql() turns into one space
+SQL_SPACE_RE = re.compile(
+    r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])|(?:\s|--[^\n]*|/\*.*?\*/)+""", re.S)
+
+_memory_lock = threading.Lock()
+_swap_lock = threading.Lock()
+_version_stamp = {}
+_version_listeners = []
+# Idle connections by (shard path or None for DB_FILE, mode); bumping the
+# generation retires them all
+_idle = {}
+_pool_lock = threading.Lock()
+_pool_generation = 0
+_shard_pools = {}
+
+
+def file_uri(path, **params):
+    """Return a SQLite URI for a file path with the given query parameters."""
+    query = "&".join(f"{k}={v}" for k, v in params.items())
+    return f"file:{quote(os.path.abspath(path))}" + (f"?{query}" if query else "")
+
+
+def current_version():
+    """
+    Return the published version of DB_FILE.
+
+    This is the content of VERSION_FILE, or the file's inode/mtime when no
+    pointer was written. It costs one stat() unless the pointer changed.
+    """
+    try:
+        st = os.stat(VERSION_FILE)
+        pointer = True
+    except FileNotFoundError:
+        st = os.stat(DB_FILE)
+        pointer = False
+    stamp = (pointer, st.st_ino, st.st_mtime_ns, st.st_size)
+    if _version_stamp.get('stamp') != stamp:
+        if pointer:
+            with open(VERSION_FILE) as f:
+                version = f.read().strip()
+        else:
+            version = f"{st.st_ino}-{st.st_mtime_ns}"
+        _version_stamp['stamp'], _version_stamp['version'] = stamp, version
+    return _version_stamp['version']
+
+
+def data_file(version=None):
+    """
+    The file holding `version` (default: the one being served). Servers open
+    this rather than DB_FILE, which db_create.py relinks only after the
+    pointer flips, so a connection always matches the version its caches are
+    keyed on. Falls back to DB_FILE for databases without data files.
+    """
+    version = version or DB.get('version') or current_version()
+    path = DB_FILE + DATA_SUFFIX + version
+    return path if os.path.exists(path) else DB_FILE
+
+
+def compact_sql(sql):
+    """`sql` on one line, without comments; string literals are left intact."""
+    return SQL_SPACE_RE.sub(lambda m: m.group(1) or " ", sql).strip()
+
+
+def on_new_version(fn):
+    """Register fn(version) to be called after the connection is swapped."""
+    _version_listeners.append(fn)
+    return fn
+
+
+def cached_per_version(fn):
+    """Memoize fn(*args) until a new database version is published."""
+    cache = {}
+    lock = threading.Lock()
+
+    @functools.wraps(fn)
+    def wrapper(*args):
+        key = (DB.get('version'), args)
+        if key not in cache:
+            with lock:
+                if key not in cache:
+                    if len(cache) > 1024:
+                        cache.clear()
+                    cache[key] = fn(*args)
+        return cache[key]
+
+    on_new_version(lambda version: cache.clear())
+    return wrapper
+
+
+def _load_memory_copy(version=None):
+    """Copy a version's data file into a shared in-memory database, once per version."""
+    version = version or DB.get('version') or current_version()
+    with _memory_lock:
+        loaded = DB.get('memory')
+        if loaded and loaded[0] == version:
+            return loaded[2]
+        name = re.sub(r'\W', '_', version)
+        uri = f"file:olympics_{name}?mode=memory&cache=shared"
+        holder = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        source = sqlite3.connect(file_uri(data_file(version), mode="ro"), uri=True)
+        try:
+            source.backup(holder)
+        finally:
+            source.close()
+        # The holder keeps the in-memory database alive until the next version;
+        # connections still open on the previous copy keep that one alive
+        DB['memory'] = (version, holder, uri)
+        logging.info(f"Loaded {DB_FILE} into memory (version {version})")
+        return uri
+
+
+def open_connection(mode=None, version=None):
+    """Open a new connection to a version (default: the served one) in the given mode."""
+    mode = mode or DB_MODE
+    if mode == "immutable":
+        conn = sqlite3.connect(
+            file_uri(data_file(version), mode="ro", immutable=1), uri=True, check_same_thread=False
+        )
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE};")
+    elif mode == "memory":
+        conn = sqlite3.connect(_load_memory_copy(version), uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only = 1;")
+    elif mode == "default":
+        conn = sqlite3.connect(data_file(version), check_same_thread=False)
+    else:
+        raise ValueError(f"Unknown DB mode {mode!r}, expected one of {DB_MODES}")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _dims_uri(mode):
+    """URI under which the served data file is attached next to a shard."""
+    if mode == "memory":
+        return _load_memory_copy()
+    if mode == "immutable":
+        return file_uri(data_file(), mode="ro", immutable=1)
+    return file_uri(data_file(), mode="ro")
+
+
+def open_with_dims(path, mode=None):
+    """
+    Open `path` (a shard file, or ":memory:") as the main schema with DB_FILE
+    attached as `dims`. Unqualified names resolve to main first, so a shard's
+    EVENT and PARTICIPATED_IN shadow the full tables while ATHLETE, TEAM, ...
+    come from DB_FILE; the app's SQL runs unchanged against one shard.
+    """
+    mode = mode or DB_MODE
+    if path == ":memory:":
+        # Private in-memory database; uri=True so the ATTACH below takes a URI
+        conn = sqlite3.connect("file::memory:", uri=True, check_same_thread=False)
+    else:
+        params = {"mode": "ro", "immutable": 1} if mode == "immutable" else {"mode": "ro"}
+        conn = sqlite3.connect(file_uri(path, **params), uri=True, check_same_thread=False)
+    if mode == "immutable":
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE};")
+    conn.execute("ATTACH DATABASE ? AS dims;", (_dims_uri(mode),))
     conn.row_factory = sqlite3.Row
+    return conn
+
+
+def shard_dir(version=None):
+    return DB_FILE + SHARDS_SUFFIX + (version or current_version())
+
+
+@cached_per_version
+def shard_layout():
+    """
+    The manifest of the current version's shards, or None when db_create.py
+    did not write any: {"by": ..., "shards": [{"file", "olympics_ids", ...}]}
+    with absolute file paths and an olympics_id -> shard index.
+    """
+    folder = shard_dir(DB.get('version'))
+    try:
+        with open(os.path.join(folder, "manifest.json")) as f:
+            layout = json.load(f)
+    except FileNotFoundError:
+        return None
+    layout["by_olympics"] = {}
+    for shard in layout["shards"]:
+        shard["path"] = os.path.join(folder, shard["file"])
+        for olympics_id in shard["olympics_ids"]:
+            layout["by_olympics"][olympics_id] = shard["path"]
+    return layout
+
+
+def shard_for(olympics_id):
+    """Path of the shard holding one Games, or None."""
+    layout = shard_layout()
+    return layout["by_olympics"].get(olympics_id) if layout else None
+
+
+@contextmanager
+def _pooled(path, mode):
+    """
+    An idle connection to a shard (see open_with_dims) or, with path None,
+    to DB_FILE (see open_connection); a new one if none is idle. It goes back
+    to the idle pool afterwards, so its statement cache is reused, unless a
+    new version was published meanwhile: then it is closed, as the idle ones
+    already were by _close_pooled_connections.
+    """
+    mode = mode or DB_MODE
+    key = (path, mode)
+    with _pool_lock:
+        generation = _pool_generation
+        idle = _idle.get(key)
+        conn = idle.pop() if idle else None
+    if conn is None:
+        conn = open_connection(mode) if path is None else open_with_dims(path, mode)
+    try:
+        yield conn
+    finally:
+        with _pool_lock:
+            if generation == _pool_generation:
+                _idle.setdefault(key, []).append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
+
+def connection(mode=None):
+    """Context manager for a pooled connection to the served database."""
+    return _pooled(None, mode)
+
+
+def shard_connection(path, mode=None):
+    """Context manager for a pooled connection to a shard, with DB_FILE as dims."""
+    return _pooled(path, mode)
+
+
+@on_new_version
+def _close_pooled_connections(version):
+    # The old data file and shard files are never read again: close the idle
+    # connections, busy ones are closed when released
+    global _pool_generation
+    with _pool_lock:
+        _pool_generation += 1
+        idle = [conn for conns in _idle.values() for conn in conns]
+        _idle.clear()
+    for conn in idle:
+        conn.close()
+
+
+def shard_map(sql, args=(), paths=None, workers=None, mode=None):
+    """
+    Run `sql` on every shard (or on `paths`) in a thread pool of `workers`
+    threads. SQLite releases the GIL while it executes, but whether that makes
+    more than one worker pay off depends on the host; see bench.py shards.
+    Returns (columns, [rows of each shard]).
+    """
+    if paths is None:
+        paths = [shard["path"] for shard in shard_layout()["shards"]]
+    workers = workers or SHARD_WORKERS
+    with _pool_lock:
+        pool = _shard_pools.get(workers)
+        if pool is None:
+            pool = _shard_pools[workers] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="shard")
+
+    def run(path):
+        with shard_connection(path, mode or DB.get('mode')) as conn:
+            cursor = conn.execute(sql, args)
+            return [d[0] for d in cursor.description], cursor.fetchall()
+
+    results = list(pool.map(run, paths))
+    columns = results[0][0] if results else []
+    return columns, [rows for _, rows in results]
+
+
+def connect(mode=None):
+    global DB
+    version = current_version()
+    conn = open_connection(mode, version)
     DB['conn'] = conn
     DB['cursor'] = conn.cursor()
-    logging.info(f"Connected to database: {DB_FILE}")
+    DB['mode'] = mode
+    DB['version'] = version
+    logging.info(f"Connected to database: {DB_FILE} ({mode or DB_MODE} mode, version {version})")
+
+
+def refresh_if_stale():
+    """
+    Reopen the shared connection if db_create.py published a new version.
+
+    The old connection is not closed here: requests that are still using
+    its cursor finish against the old file, and it is released once they
+    drop their references. Returns True when a swap happened.
+    """
+    if DB.get('version') == current_version():
+        return False
+    with _swap_lock:
+        if DB.get('version') == current_version():
+            return False
+        connect(DB.get('mode'))
+    for fn in _version_listeners:
+        fn(DB['version'])
+    return True
+
+def watch_version(interval=VERSION_POLL):
+    """
+    Poll the version pointer in a daemon thread and swap to a newly published
+    database as soon as it appears, so on_new_version listeners (warm-up,
+    cache resets) run before the first request for it rather than in it.
+    """
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                refresh_if_stale()
+            except Exception:
+                logging.exception("Picking up the new database version failed")
+
+    thread = threading.Thread(target=loop, name="version-watcher", daemon=True)
+    thread.start()
+    return thread
+
 
-def execute(sql, args=None):
-    sql = re.sub(r'\s+', ' ', sql).strip()
+def execute(sql, args=None, conn=None):
+    """Run sql on the shared cursor, or on a cursor of `conn` when given."""
+    sql = compact_sql(sql)
     logging.info(f"SQL: {sql} | Args: {args}")
+    cursor = conn.cursor() if conn is not None else DB['cursor']
     if args:
-        return DB['cursor'].execute(sql, args)
-    return DB['cursor'].execute(sql)
+        return cursor.execute(sql, args)
+    return cursor.execute(sql)
 
 def close():
     DB['conn'].close()
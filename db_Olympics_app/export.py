@@ -0,0 +1,210 @@
+#! /usr/bin/python3
+"""
+Streaming export of tables and question results.
+
+Rows are pulled with fetchmany() in fixed-size batches and each batch is
+encoded and handed on before the next one is fetched, so memory stays
+bounded by the batch size whatever the table size. CSV and NDJSON need
+only the standard library; Parquet and Arrow IPC need pyarrow.
+
+Usage:
+  python export.py TABLE|qN [--format csv|ndjson|parquet|arrow] [-o FILE]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+import db
+from question_registry import QuestionRegistry
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet / Arrow export stay unavailable
+    pa = pq = None
+
+# Tables that may be exported by name
+TABLES = ("ATHLETE", "TEAM", "SPORT", "OLYMPICS", "EVENT", "IN_THE_TEAM", "PARTICIPATED_IN")
+BATCH_SIZE = 50_000
+SQL_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions')
+
+
+def batches(cursor, size=BATCH_SIZE):
+    """Yield lists of at most `size` rows until the cursor is exhausted."""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def columns_of(cursor):
+    return [d[0] for d in cursor.description]
+
+
+def iter_csv(cursor):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns_of(cursor))
+    for rows in batches(cursor):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def iter_ndjson(cursor):
+    columns = columns_of(cursor)
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    for rows in batches(cursor):
+        yield "".join(encode(dict(zip(columns, row))) + "\n" for row in rows).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that collects what pyarrow writes until drained."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_type(storage_classes):
+    """Arrow type for a column whose values have the given SQLite storage classes."""
+    classes = set(storage_classes) - {"null"}
+    if classes == {"integer"}:
+        return pa.int64()
+    if classes and classes <= {"integer", "real"}:
+        return pa.float64()
+    if classes == {"blob"}:
+        return pa.binary()
+    # Text, mixed, or no values at all
+    return pa.string()
+
+
+def arrow_schema(conn, sql, args, names):
+    """
+    Arrow schema of the result of `sql` from the storage classes of all its
+    values, found by one extra pass in SQLite. With SQLite's dynamic typing
+    neither the declared types nor the first rows tell what a column holds
+    further down, and the schema cannot change once streaming has started.
+    """
+    aliases = ", ".join(f"c{i}" for i in range(len(names)))
+    classes = ", ".join(f"group_concat(DISTINCT typeof(c{i}))" for i in range(len(names)))
+    row = conn.execute(
+        f"WITH src({aliases}) AS ({sql.rstrip().rstrip(';')}) SELECT {classes} FROM src;",
+        args or ()).fetchone()
+    return pa.schema([
+        pa.field(name, arrow_type((found or "").split(","))) for name, found in zip(names, row)
+    ])
+
+
+def _arrow_array(values, type):
+    if type == pa.string():
+        return pa.array([None if v is None else str(v) for v in values], type=type)
+    if type == pa.float64():
+        return pa.array([None if v is None else float(v) for v in values], type=type)
+    return pa.array(values, type=type)
+
+
+def _iter_arrow_writer(cursor, schema, open_writer):
+    """Convert row batches straight to Arrow record batches (column-wise) and encode them."""
+    sink = _ChunkSink()
+    writer = open_writer(sink, schema)
+    for rows in batches(cursor):
+        arrays = [_arrow_array(col, field.type) for col, field in zip(zip(*rows), schema)]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def iter_parquet(cursor, schema):
+    return _iter_arrow_writer(cursor, schema, lambda sink, schema: pq.ParquetWriter(sink, schema))
+
+
+def iter_arrow(cursor, schema):
+    return _iter_arrow_writer(cursor, schema, lambda sink, schema: pa.ipc.new_stream(sink, schema))
+
+
+# format -> (encoder, mimetype)
+FORMATS = {
+    "csv": (iter_csv, "text/csv"),
+    "ndjson": (iter_ndjson, "application/x-ndjson"),
+    "parquet": (iter_parquet, "application/vnd.apache.parquet"),
+    "arrow": (iter_arrow, "application/vnd.apache.arrow.stream"),
+}
+
+
+def source_sql(name, questions=None):
+    """
+    SQL and args for an export source: a table name or `q<number>`.
+    Raises ValueError for anything else.
+    """
+    if name.upper() in TABLES:
+        return f"SELECT * FROM {name.upper()};", None
+    if name[:1] in "qQ" and name[1:].isdigit() and questions is not None:
+        question = questions.get(int(name[1:]))
+        if question is not None:
+            return question.sql, question.bind({})
+    raise ValueError(f"Unknown export source {name!r}")
+
+
+def stream(name, fmt, conn=None, questions=None):
+    """Yield the encoded export of `name` in `fmt`, batch by batch."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {list(FORMATS)}")
+    if fmt in ("parquet", "arrow") and pa is None:
+        raise ValueError(f"{fmt} export requires pyarrow (pip install pyarrow)")
+    sql, args = source_sql(name, questions)
+    encoder = FORMATS[fmt][0]
+    cursor = db.execute(sql, args, conn=conn)
+    if fmt in ("parquet", "arrow"):
+        # Typed before the first byte goes out, so a batch cannot fail mid-stream
+        schema = arrow_schema(cursor.connection, sql, args, columns_of(cursor))
+        return encoder(cursor, schema)
+    return encoder(cursor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a table or question result.")
+    parser.add_argument("source", help="table name, or qN for questions/N.sql")
+    parser.add_argument("--format", choices=list(FORMATS), default="csv")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    db.connect()
+    try:
+        chunks = stream(args.source, args.format, questions=QuestionRegistry(SQL_FOLDER))
+        out = open(args.output, "wb") if args.output else sys.stdout.buffer
+        with out:
+            for chunk in chunks:
+                out.write(chunk)
+    except ValueError as exc:
+        sys.exit(str(exc))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
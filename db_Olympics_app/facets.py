@@ -0,0 +1,295 @@
+"""
+Faceted search over participations: bitmap indexes plus an SQL fallback.
+
+Participations can be filtered by any combination of sex, sport, season,
+year range, NOC and medal. Every dimension reports a live count per value:
+the number of matches if that dimension's own selection were replaced by
+the value, i.e. with every *other* filter applied.
+
+FacetIndex holds, for every value of every dimension, a bitmap over the
+participations (bit i = i-th participation in display order), packed into
+uint64 words and stacked per dimension. A search is a few bitwise ORs (values
+of one dimension) and ANDs (across dimensions), and the counts of a whole
+dimension are one AND + popcount over its stacked bitmaps (np.bitwise_count
+on NumPy >= 2.0, a byte lookup table on older NumPy). sql_search() answers
+the same request with GROUP BY queries when the index is disabled.
+"""
+import json
+import logging
+
+import numpy as np
+
+PAGE_SIZE = 50
+
+if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+    bitwise_count = np.bitwise_count
+else:
+    _BYTE_COUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def bitwise_count(words):
+        """Set bits per uint64 word, from a lookup table of the 8 bytes."""
+        words = np.ascontiguousarray(words, dtype=np.uint64)
+        return _BYTE_COUNTS[words.view(np.uint8)].reshape(*words.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+# dimension -> SQL expression over FROM_SQL; NULL values have no facet
+DIMENSIONS = {
+    "sex": "a.sex",
+    "sport": "s.name",
+    "season": "o.season",
+    "year": "o.year",
+    "noc": "t.noc",
+    "medal": "COALESCE(NULLIF(pi.medal, 'NA'), 'No medal')",
+}
+RANGE_DIMENSIONS = {"year"}
+
+FROM_SQL = """
+    PARTICIPATED_IN pi
+    JOIN ATHLETE a  ON a.athlete_id = pi.athlete_id
+    JOIN EVENT e    ON e.event_id = pi.event_id
+    JOIN SPORT s    ON s.sport_id = e.sport_id
+    JOIN OLYMPICS o ON o.olympics_id = e.olympics_id
+    LEFT JOIN TEAM t ON t.team_id = pi.team_id
+"""
+ORDER_SQL = "o.year, o.season, s.name, e.name, a.name, pi.rowid"
+
+ROWS_SQL = """
+    SELECT a.athlete_id, a.name AS athlete_name, a.sex, e.event_id,
+           e.name AS event_name, s.sport_id, s.name AS sport, o.year,
+           o.season, t.team_id, t.noc, pi.medal
+    FROM json_each(:ids) j
+    JOIN PARTICIPATED_IN pi ON pi.rowid = j.value
+    JOIN ATHLETE a  ON a.athlete_id = pi.athlete_id
+    JOIN EVENT e    ON e.event_id = pi.event_id
+    JOIN SPORT s    ON s.sport_id = e.sport_id
+    JOIN OLYMPICS o ON o.olympics_id = e.olympics_id
+    LEFT JOIN TEAM t ON t.team_id = pi.team_id
+    ORDER BY j.key;
+"""
+
+
+def parse_filters(args):
+    """
+    Filters from a request's query string (a werkzeug MultiDict):
+    ?sex=F&sport=Rowing&sport=Judo&year_from=1990&year_to=2000 ...
+    Raises ValueError for a non-integer year.
+    """
+    filters = {}
+    for name in DIMENSIONS:
+        if name in RANGE_DIMENSIONS:
+            bounds = []
+            for key in (f"{name}_from", f"{name}_to"):
+                value = (args.get(key) or "").strip()
+                try:
+                    bounds.append(int(value) if value else None)
+                except ValueError:
+                    raise ValueError(f"{key} must be an integer, got {value!r}") from None
+            if bounds != [None, None]:
+                filters[name] = tuple(bounds)
+        else:
+            values = list(dict.fromkeys(v for v in args.getlist(name) if v))
+            if values:
+                filters[name] = values
+    return filters
+
+
+def _in_range(value, bounds):
+    low, high = bounds
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+def _selected(name, value, filters):
+    selection = filters.get(name)
+    if selection is None:
+        return False
+    if name in RANGE_DIMENSIONS:
+        return _in_range(value, selection)
+    return value in selection
+
+
+def _facet_list(name, counts, filters):
+    """
+    [(value, count, selected)] in value order. Values with no match are left
+    out, except the ones picked in a (non-range) selection, so they can be
+    unticked.
+    """
+    listed = [(value, count, _selected(name, value, filters))
+              for value, count in counts if count]
+    if name not in RANGE_DIMENSIONS:
+        known = {value for value, _, _ in listed}
+        listed += [(value, 0, True) for value in filters.get(name, []) if value not in known]
+        listed.sort(key=lambda item: item[0])
+    return listed
+
+
+class FacetDimension:
+    """
+    The values of one dimension, their stacked bitmaps (values x words) and
+    their unfiltered counts.
+    """
+
+    __slots__ = ("values", "bitmaps", "totals")
+
+    def __init__(self, values, bitmaps):
+        self.values = values
+        self.bitmaps = bitmaps
+        self.totals = bitwise_count(bitmaps).sum(axis=1)
+
+    def counts(self, others):
+        """Matches per value within the `others` bitmap (None = everything)."""
+        if others is None:
+            return self.totals
+        # Bits are in year / season / sport order, so those filters leave a
+        # narrow span of non-zero words; only that span is intersected
+        nonzero = np.flatnonzero(others)
+        if not nonzero.size:
+            return np.zeros(len(self.values), dtype=np.int64)
+        low, high = nonzero[0], nonzero[-1] + 1
+        return bitwise_count(self.bitmaps[:, low:high] & others[low:high]).sum(axis=1)
+
+    def mask(self, selection, words):
+        """OR of the bitmaps of the selected values (a list, or a range)."""
+        if isinstance(selection, tuple):
+            rows = [i for i, v in enumerate(self.values) if _in_range(v, selection)]
+        else:
+            position = {v: i for i, v in enumerate(self.values)}
+            rows = [position[v] for v in selection if v in position]
+        if not rows:
+            return np.zeros(words, dtype=np.uint64)
+        return np.bitwise_or.reduce(self.bitmaps[rows], axis=0)
+
+
+class FacetIndex:
+    """Bitmap index of the participations for one database version."""
+
+    __slots__ = ("size", "rowids", "dimensions")
+
+    def __init__(self, conn):
+        columns = ", ".join(DIMENSIONS.values())
+        rows = conn.execute(
+            f"SELECT pi.rowid, {columns} FROM {FROM_SQL} ORDER BY {ORDER_SQL};").fetchall()
+        self.size = len(rows)
+        self.rowids = np.array([r[0] for r in rows], dtype=np.int64)
+        positions = np.arange(self.size, dtype=np.int64)
+        words = (self.size + 63) // 64
+        self.dimensions = {}
+        for k, name in enumerate(DIMENSIONS, start=1):
+            column = [r[k] for r in rows]
+            values = sorted({v for v in column if v is not None})
+            code = {v: i for i, v in enumerate(values)}
+            codes = np.array([code.get(v, -1) for v in column], dtype=np.int64)
+            has_value = codes >= 0
+            bitmaps = np.zeros((len(values), words), dtype=np.uint64)
+            np.bitwise_or.at(
+                bitmaps,
+                (codes[has_value], positions[has_value] >> 6),
+                np.left_shift(np.uint64(1), (positions[has_value] & 63).astype(np.uint64)),
+            )
+            self.dimensions[name] = FacetDimension(values, bitmaps)
+        logging.info(
+            f"Facet index: {self.size} participations, "
+            f"{sum(len(d.values) for d in self.dimensions.values())} bitmaps, "
+            f"{self.nbytes / 2**20:.1f} MiB"
+        )
+
+    @property
+    def nbytes(self):
+        return self.rowids.nbytes + sum(d.bitmaps.nbytes for d in self.dimensions.values())
+
+    def _all(self, words):
+        mask = np.full(words, np.iinfo(np.uint64).max, dtype=np.uint64)
+        if self.size % 64:
+            mask[-1] = np.uint64((1 << (self.size % 64)) - 1)
+        return mask
+
+    def search(self, filters, offset=0, limit=PAGE_SIZE):
+        """
+        (total, {dimension: [(value, count, selected)]}, participation rowids
+        of the requested page) for `filters` as returned by parse_filters.
+        """
+        words = (self.size + 63) // 64
+        everything = self._all(words)
+        masks = {name: self.dimensions[name].mask(selection, words)
+                 for name, selection in filters.items()}
+
+        facets = {}
+        for name, dimension in self.dimensions.items():
+            others = None
+            for other, mask in masks.items():
+                if other != name:
+                    others = mask if others is None else others & mask
+            counts = dimension.counts(others)
+            facets[name] = _facet_list(name, zip(dimension.values, counts.tolist()), filters)
+
+        match = everything
+        for mask in masks.values():
+            match = match & mask
+        # Unpack only the words that hold the requested page
+        ends = np.cumsum(bitwise_count(match))
+        total = int(ends[-1]) if ends.size else 0
+        first = int(np.searchsorted(ends, offset, side="right"))
+        last = int(np.searchsorted(ends, offset + limit, side="left")) + 1
+        words_bits = np.unpackbits(match[first:last].astype("<u8").view(np.uint8), bitorder="little")
+        skip = offset - (int(ends[first - 1]) if first else 0)
+        page = first * 64 + np.flatnonzero(words_bits)[skip:skip + limit]
+        return total, facets, self.rowids[page].tolist()
+
+    def verify(self, conn):
+        """
+        True when SQLite gives the same answer unfiltered and for a filtered
+        second page: the most common sport over the later half of the years.
+        """
+        checks = [({}, 0)]
+        sport, year = self.dimensions["sport"], self.dimensions["year"]
+        if sport.values and year.values:
+            sport_value = sport.values[int(np.argmax(sport.totals))]
+            year_range = (year.values[len(year.values) // 2], None)
+            checks.append(({"sport": [sport_value], "year": year_range}, PAGE_SIZE))
+        for filters, offset in checks:
+            if self.search(filters, offset) != sql_search(conn, filters, offset):
+                logging.warning(f"Facet index differs from SQLite for {filters}; facets served by SQL")
+                return False
+        return True
+
+
+def _where(filters, skip=None):
+    clauses, args = [], []
+    for name, selection in filters.items():
+        if name == skip:
+            continue
+        expr = DIMENSIONS[name]
+        if name in RANGE_DIMENSIONS:
+            low, high = selection
+            if low is not None:
+                clauses.append(f"{expr} >= ?")
+                args.append(low)
+            if high is not None:
+                clauses.append(f"{expr} <= ?")
+                args.append(high)
+        else:
+            clauses.append(f"{expr} IN ({', '.join('?' for _ in selection)})")
+            args.extend(selection)
+    return clauses, args
+
+
+def sql_search(conn, filters, offset=0, limit=PAGE_SIZE):
+    """Same answer as FacetIndex.search, with one GROUP BY per dimension."""
+    facets = {}
+    for name, expr in DIMENSIONS.items():
+        clauses, args = _where(filters, skip=name)
+        where = " AND ".join(clauses + [f"{expr} IS NOT NULL"])
+        counts = conn.execute(
+            f"SELECT {expr}, COUNT(*) FROM {FROM_SQL} WHERE {where} GROUP BY 1 ORDER BY 1;", args)
+        facets[name] = _facet_list(name, [tuple(r) for r in counts], filters)
+
+    clauses, args = _where(filters)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    total = conn.execute(f"SELECT COUNT(*) FROM {FROM_SQL} {where};", args).fetchone()[0]
+    rowids = [r[0] for r in conn.execute(
+        f"SELECT pi.rowid FROM {FROM_SQL} {where} ORDER BY {ORDER_SQL} LIMIT ? OFFSET ?;",
+        args + [limit, offset])]
+    return total, facets, rowids
+
+
+def participations(conn, rowids):
+    """The result rows of one page, in the order of `rowids`."""
+    return [dict(r) for r in conn.execute(ROWS_SQL, {"ids": json.dumps(rowids)})]
@@ -0,0 +1,209 @@
+"""
+Typo-tolerant name search over athletes and teams.
+
+Names are normalized (accents stripped, case folded, punctuation dropped)
+and cut into padded character trigrams per word. FuzzyIndex keeps, for every
+distinct trigram (encoded as one int64), a posting array of the names that
+contain it, in CSR form like graph.py; names themselves are packed into one
+UTF-8 buffer. A search
+  1. counts, for every name, the query trigrams it shares (one bincount over
+     the concatenated postings) and keeps the names above the q-gram bound
+     for the allowed number of edits, the CANDIDATES most similar first;
+  2. verifies each candidate word by word with a bounded edit distance
+     (transpositions count as one edit): every query word must match some
+     word of the name, or else (for the WHOLE_NAME_CHECKS most similar) the
+     whole names, spaces removed, must be within MAX_DISTANCE edits;
+  3. ranks by total distance, exact names first, then by the number of
+     extra words, then name.
+"""
+import logging
+import unicodedata
+
+import numpy as np
+
+from graph import StringColumn
+
+CANDIDATES = 64         # names verified per query, most similar first
+WHOLE_NAME_CHECKS = 32  # of those, names compared whole when words do not match
+TOP_K = 20
+MAX_DISTANCE = 2        # edits allowed per query word (fewer for short words)
+
+KINDS = {
+    "athletes": "SELECT athlete_id, name FROM ATHLETE WHERE name IS NOT NULL ORDER BY athlete_id;",
+    "teams": "SELECT team_id, name FROM TEAM WHERE name IS NOT NULL ORDER BY team_id;",
+}
+
+
+# ASCII punctuation -> space, for the common all-ASCII name
+_ASCII_SEPARATORS = str.maketrans({chr(c): " " for c in range(128) if not chr(c).isalnum()})
+
+
+def normalize(text):
+    """'Zoë  Müller-Smith' -> 'zoe muller smith'"""
+    if not text.isascii():
+        decomposed = unicodedata.normalize("NFKD", text)
+        text = "".join(c if c.isalnum() else " " for c in decomposed if not unicodedata.combining(c))
+    return " ".join(text.casefold().translate(_ASCII_SEPARATORS).split())
+
+
+def word_budget(word, max_distance=MAX_DISTANCE):
+    """Edits allowed for one query word: none up to 2 letters, 1 up to 5."""
+    if len(word) <= 2:
+        return 0
+    return min(max_distance, 1 if len(word) <= 5 else 2)
+
+
+def trigrams(words):
+    """Distinct codes of the trigrams of every word padded with two spaces."""
+    codes = set()
+    for word in words:
+        padded = [0, 0] + [ord(c) for c in word] + [0, 0]
+        for i in range(len(padded) - 2):
+            codes.add((padded[i] << 42) | (padded[i + 1] << 21) | padded[i + 2])
+    return codes
+
+
+def bounded_distance(a, b, bound):
+    """
+    Edit distance between a and b counting an adjacent transposition as one
+    edit (optimal string alignment), or bound + 1 once it exceeds bound.
+    Only the cells within `bound` of the diagonal are computed.
+    """
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    over = bound + 1
+    before, previous = None, [j if j <= bound else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        low, high = max(1, i - bound), min(len(b), i + bound)
+        current = [over] * (len(b) + 1)
+        if i <= bound:
+            current[0] = i
+        ca = a[i - 1]
+        for j in range(low, high + 1):
+            cb = b[j - 1]
+            cost = previous[j - 1] + (ca != cb)
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            if j > 1 and i > 1 and ca == b[j - 2] and a[i - 2] == cb and before[j - 2] + 1 < cost:
+                cost = before[j - 2] + 1
+            current[j] = cost
+        if min(current[low - 1:high + 1]) > bound:
+            return over
+        before, previous = previous, current
+    return min(previous[-1], over)
+
+
+class FuzzyIndex:
+    """Trigram postings of the names of one kind (athletes or teams)."""
+
+    __slots__ = ("ids", "names", "keys", "gram_counts", "gram_codes", "gram_offsets", "postings")
+
+    def __init__(self, rows):
+        self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.names = StringColumn.from_values([r[1] for r in rows])
+        keys = [normalize(r[1]) for r in rows]
+        self.keys = StringColumn.from_values(keys)
+        # Trigrams are computed once per distinct word
+        word_grams = {}
+        codes, owners = [], []
+        for i, key in enumerate(keys):
+            grams = set()
+            for word in key.split():
+                if word not in word_grams:
+                    word_grams[word] = trigrams([word])
+                grams |= word_grams[word]
+            codes.extend(grams)
+            owners.extend([i] * len(grams))
+        codes = np.array(codes, dtype=np.int64)
+        owners = np.array(owners, dtype=np.int32)
+        self.gram_counts = np.bincount(owners, minlength=len(keys)).astype(np.int32)
+        order = np.lexsort((owners, codes))
+        self.gram_codes, counts = np.unique(codes[order], return_counts=True)
+        self.gram_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.gram_offsets[1:])
+        self.postings = owners[order]
+
+    @classmethod
+    def from_sql(cls, conn, kind):
+        return cls(conn.execute(KINDS[kind]).fetchall())
+
+    @property
+    def nbytes(self):
+        return (self.ids.nbytes + self.names.nbytes + self.keys.nbytes + self.gram_counts.nbytes
+                + self.gram_codes.nbytes + self.gram_offsets.nbytes + self.postings.nbytes)
+
+    def candidates(self, words, max_distance=MAX_DISTANCE):
+        """Indices of the names sharing enough trigrams with `words`, most similar first."""
+        grams = np.fromiter(trigrams(words), dtype=np.int64)
+        slots = np.searchsorted(self.gram_codes, grams)
+        slots = slots[slots < len(self.gram_codes)]
+        slots = slots[np.isin(self.gram_codes[slots], grams)]
+        if not slots.size:
+            return np.empty(0, dtype=np.int64)
+        shared = np.bincount(
+            np.concatenate([self.postings[self.gram_offsets[s]:self.gram_offsets[s + 1]] for s in slots]),
+            minlength=len(self.ids),
+        )
+        # Each edit destroys at most 3 trigrams, a transposition 4 (q-gram lemma)
+        needed = max(1, len(grams) - 4 * sum(word_budget(w, max_distance) for w in words))
+        found = np.flatnonzero(shared >= needed)
+        # Most similar first (Jaccard over trigrams), so long names that
+        # share many trigrams by chance do not crowd out close ones
+        common = shared[found]
+        similarity = common / (len(grams) + self.gram_counts[found] - common)
+        if len(found) > CANDIDATES:
+            best = np.argpartition(-similarity, CANDIDATES)[:CANDIDATES]
+            found, similarity = found[best], similarity[best]
+        return found[np.argsort(-similarity, kind="stable")]
+
+    def search(self, query, limit=TOP_K, max_distance=MAX_DISTANCE):
+        """[(id, name, distance)] of the best `limit` matches of `query`."""
+        key = normalize(query)
+        words = key.split()
+        if not words:
+            return []
+        budgets = [word_budget(w, max_distance) for w in words]
+        compact = key.replace(" ", "")
+        whole_name_checks = WHOLE_NAME_CHECKS
+        # Names share most of their words: each word pair is compared once
+        distances = [{} for _ in words]
+        ranked = []
+        for i in self.candidates(words, max_distance).tolist():
+            name_key = self.keys[i]
+            name_words = name_key.split()
+            total, matched = 0, True
+            for word, budget, seen in zip(words, budgets, distances):
+                if word in name_words:
+                    continue
+                best = budget + 1
+                for other in name_words:
+                    if other not in seen:
+                        seen[other] = bounded_distance(word, other, budget)
+                    best = min(best, seen[other])
+                if best > budget:
+                    # A typo in a short word, or one that merged or split
+                    # words: compare the whole names without spaces
+                    matched = whole_name_checks > 0 and (
+                        budget < max_distance or len(name_words) != len(words))
+                    if matched:
+                        whole_name_checks -= 1
+                        total = bounded_distance(compact, name_key.replace(" ", ""), max_distance)
+                        matched = total <= max_distance
+                    break
+                total += best
+            if matched:
+                ranked.append((total, name_key != key, len(name_words) - len(words), self.names[i], i))
+        ranked.sort()
+        return [(int(self.ids[i]), name, total) for total, _, _, name, i in ranked[:limit]]
+
+
+def build(conn):
+    """{kind: FuzzyIndex} for every kind in KINDS."""
+    indexes = {kind: FuzzyIndex.from_sql(conn, kind) for kind in KINDS}
+    logging.info("Fuzzy name index: " + ", ".join(
+        f"{len(index.ids)} {kind} ({index.nbytes / 2**20:.1f} MiB)" for kind, index in indexes.items()))
+    return indexes
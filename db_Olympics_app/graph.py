@@ -0,0 +1,365 @@
+"""
+In-process entity graph used to serve the detail pages without SQL.
+
+Every table is held column-wise (NumPy arrays, strings packed into one UTF-8
+buffer) and every relationship as CSR adjacency: for an entity at dense
+index i, its neighbours are indices[offsets[i]:offsets[i + 1]]. Edges are
+pre-sorted in the order the detail pages display them, so each lookup is an
+O(degree) slice.
+"""
+import logging
+
+import numpy as np
+
+
+class StringColumn:
+    """Nullable strings packed into one UTF-8 buffer plus int64 offsets."""
+
+    __slots__ = ("data", "offsets", "valid")
+
+    def __init__(self, data, offsets, valid):
+        self.data = data
+        self.offsets = offsets
+        self.valid = valid
+
+    @classmethod
+    def from_values(cls, values):
+        encoded = [(v or "").encode() for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        valid = np.array([v is not None for v in values], dtype=bool)
+        return cls(data, offsets, valid)
+
+    def __len__(self):
+        return len(self.valid)
+
+    def __getitem__(self, i):
+        if not self.valid[i]:
+            return None
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode()
+
+    def tolist(self):
+        buf, offsets = self.data.tobytes(), self.offsets.tolist()
+        return [buf[offsets[i]:offsets[i + 1]].decode() if ok else None
+                for i, ok in enumerate(self.valid.tolist())]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes + self.valid.nbytes
+
+
+class NumberColumn:
+    """Nullable numbers: a typed value array plus a validity mask."""
+
+    __slots__ = ("values", "valid")
+
+    def __init__(self, values, valid):
+        self.values = values
+        self.valid = valid
+
+    @classmethod
+    def from_values(cls, values, dtype):
+        valid = np.array([v is not None for v in values], dtype=bool)
+        data = np.array([0 if v is None else v for v in values], dtype=dtype)
+        return cls(data, valid)
+
+    def __len__(self):
+        return len(self.valid)
+
+    def __getitem__(self, i):
+        return self.values[i].item() if self.valid[i] else None
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.valid.nbytes
+
+
+def sort_rank(column):
+    """
+    Dense sort rank of each value in SQLite order (NULLs first, then binary
+    order); equal values share a rank.
+    """
+    values = column.tolist() if isinstance(column, StringColumn) else [
+        column[i] for i in range(len(column))
+    ]
+    keys = [(0, 0) if v is None else (1, v) for v in values]
+    ranks = {k: r for r, k in enumerate(sorted(set(keys)))}
+    return np.array([ranks[k] for k in keys], dtype=np.int32)
+
+
+def _csr(owner, n_owner, *sort_keys):
+    """
+    Group edges by owner. Returns (offsets, order) where order permutes the
+    edge arrays so each owner's edges are contiguous and sorted by sort_keys.
+    """
+    order = np.lexsort(tuple(reversed(sort_keys)) + (owner,)) if len(owner) else np.empty(0, np.int64)
+    offsets = np.zeros(n_owner + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner, minlength=n_owner), out=offsets[1:])
+    return offsets, order.astype(np.int32)
+
+
+class Table:
+    """Columns of one entity table, rows sorted by primary key."""
+
+    __slots__ = ("ids", "columns")
+
+    def __init__(self, ids, columns):
+        self.ids = ids
+        self.columns = columns
+
+    def index(self, pk):
+        """Dense row index for a primary key, or None."""
+        i = int(np.searchsorted(self.ids, pk))
+        if i < len(self.ids) and self.ids[i] == pk:
+            return i
+        return None
+
+    def indices(self, pks):
+        """Vectorised index(): maps an array of foreign keys to dense indices."""
+        return np.searchsorted(self.ids, pks).astype(np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + sum(c.nbytes for c in self.columns.values())
+
+
+def load_table(conn, table, pk, columns):
+    """Load (name, type) `columns` of `table` into a Table ordered by `pk`."""
+    rows = conn.execute(
+        f"SELECT {pk}, {', '.join(c for c, _ in columns)} FROM {table} ORDER BY {pk};"
+    ).fetchall()
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    cols = {}
+    for pos, (name, kind) in enumerate(columns, start=1):
+        values = [r[pos] for r in rows]
+        if kind is str:
+            cols[name] = StringColumn.from_values(values)
+        else:
+            cols[name] = NumberColumn.from_values(values, kind)
+    return Table(ids, cols)
+
+
+class EntityGraph:
+    """Athlete/team/event/sport/olympics graph loaded from Olympics.db."""
+
+    def __init__(self, conn):
+        self.athletes = load_table(conn, "ATHLETE", "athlete_id", [
+            ("name", str), ("sex", str), ("height", np.float64), ("weight", np.float64)])
+        self.teams = load_table(conn, "TEAM", "team_id", [("name", str), ("noc", str)])
+        self.sports = load_table(conn, "SPORT", "sport_id", [("name", str)])
+        self.olympics = load_table(conn, "OLYMPICS", "olympics_id", [
+            ("name", str), ("year", np.int32), ("season", str), ("city", str)])
+        self.events = load_table(conn, "EVENT", "event_id", [
+            ("name", str), ("sport_id", np.int64), ("olympics_id", np.int64)])
+        self.event_sport = self.sports.indices(self.events.columns["sport_id"].values)
+        self.event_olympics = self.olympics.indices(self.events.columns["olympics_id"].values)
+
+        it = np.array(conn.execute(
+            "SELECT athlete_id, team_id FROM IN_THE_TEAM;").fetchall(), dtype=np.int64).reshape(-1, 2)
+        it_athlete = self.athletes.indices(it[:, 0])
+        it_team = self.teams.indices(it[:, 1])
+
+        pi = conn.execute(
+            "SELECT athlete_id, event_id, age, medal, team_id FROM PARTICIPATED_IN;").fetchall()
+        pi_athlete = self.athletes.indices(np.array([r[0] for r in pi], dtype=np.int64))
+        pi_event = self.events.indices(np.array([r[1] for r in pi], dtype=np.int64))
+        # Team the participation was under, -1 when unknown
+        pi_team_id = np.array([-1 if r[4] is None else r[4] for r in pi], dtype=np.int64)
+        self.pi_team = np.where(pi_team_id >= 0, self.teams.indices(pi_team_id), -1).astype(np.int32)
+        # Medals are small integer codes into self.medals (code 0 = no medal)
+        self.medals = [None] + sorted({r[3] for r in pi if r[3] is not None})
+        codes = {m: c for c, m in enumerate(self.medals)}
+        self.pi_medal = np.array([codes[r[3]] for r in pi], dtype=np.int8)
+
+        athlete_name = sort_rank(self.athletes.columns["name"])
+        team_name = sort_rank(self.teams.columns["name"])
+        sport_name = sort_rank(self.sports.columns["name"])
+        event_name = sort_rank(self.events.columns["name"])
+        year = sort_rank(self.olympics.columns["year"])
+        event_year = year[self.event_olympics]
+        event_sport_name = sport_name[self.event_sport]
+        n_athletes, n_teams = len(self.athletes), len(self.teams)
+        n_events = len(self.events)
+
+        # ATHLETE -> TEAM, ORDER BY team name
+        self.athlete_team_off, order = _csr(it_athlete, n_athletes, team_name[it_team], it_team)
+        self.athlete_team_idx = it_team[order]
+        # TEAM -> ATHLETE, ORDER BY athlete name
+        self.team_athlete_off, order = _csr(it_team, n_teams, athlete_name[it_athlete], it_athlete)
+        self.team_athlete_idx = it_athlete[order]
+        # ATHLETE -> participation, ORDER BY year, sport name, event name
+        self.athlete_part_off, self.athlete_part_idx = _csr(
+            pi_athlete, n_athletes,
+            event_year[pi_event], event_sport_name[pi_event], event_name[pi_event], pi_event)
+        # EVENT -> participation, ORDER BY athlete name
+        self.event_part_off, self.event_part_idx = _csr(
+            pi_event, n_events, athlete_name[pi_athlete], pi_athlete)
+        # SPORT -> EVENT, ORDER BY year, event name
+        event_ids = np.arange(n_events, dtype=np.int32)
+        self.sport_event_off, self.sport_event_idx = _csr(
+            self.event_sport, len(self.sports), event_year, event_name, event_ids)
+        # OLYMPICS -> EVENT, ORDER BY sport name, event name
+        self.olympics_event_off, self.olympics_event_idx = _csr(
+            self.event_olympics, len(self.olympics), event_sport_name, event_name, event_ids)
+
+        self.pi_athlete = pi_athlete
+        self.pi_event = pi_event
+        # Per-team medal histogram over the participations made for that team
+        has_team = self.pi_team >= 0
+        self.team_medal_counts = np.zeros((n_teams, len(self.medals)), dtype=np.int32)
+        np.add.at(self.team_medal_counts, (self.pi_team[has_team], self.pi_medal[has_team]), 1)
+
+        logging.info(f"Entity graph loaded: {self.nbytes / 2**20:.1f} MiB")
+
+    @property
+    def nbytes(self):
+        total = sum(t.nbytes for t in (self.athletes, self.teams, self.sports, self.olympics, self.events))
+        total += sum(v.nbytes for v in vars(self).values() if isinstance(v, np.ndarray))
+        return total
+
+    @staticmethod
+    def _slice(offsets, indices, i):
+        return indices[offsets[i]:offsets[i + 1]]
+
+    def _row(self, table, i, pk_name, names=None):
+        cols = table.columns
+        row = {pk_name: int(table.ids[i])}
+        for col in names or cols:
+            row[col] = cols[col][i]
+        return row
+
+    # -------- ATHLETE --------
+    def athlete(self, athlete_id):
+        i = self.athletes.index(athlete_id)
+        return None if i is None else self._row(self.athletes, i, "athlete_id")
+
+    def athlete_teams(self, athlete_id):
+        i = self.athletes.index(athlete_id)
+        if i is None:
+            return []
+        return [self._row(self.teams, t, "team_id")
+                for t in self._slice(self.athlete_team_off, self.athlete_team_idx, i)]
+
+    def athlete_participations(self, athlete_id):
+        i = self.athletes.index(athlete_id)
+        if i is None:
+            return []
+        rows = []
+        for p in self._slice(self.athlete_part_off, self.athlete_part_idx, i):
+            e = self.pi_event[p]
+            s, o = self.event_sport[e], self.event_olympics[e]
+            games = self.olympics.columns
+            rows.append({
+                "event_id": int(self.events.ids[e]),
+                "event_name": self.events.columns["name"][e],
+                "sport_id": int(self.sports.ids[s]),
+                "sport": self.sports.columns["name"][s],
+                "year": games["year"][o],
+                "season": games["season"][o],
+                "city": games["city"][o],
+                "olympics_id": int(self.olympics.ids[o]),
+                "medal": self.medals[self.pi_medal[p]],
+            })
+        return rows
+
+    # -------- TEAM --------
+    def team(self, team_id):
+        i = self.teams.index(team_id)
+        return None if i is None else self._row(self.teams, i, "team_id")
+
+    def team_athletes(self, team_id):
+        i = self.teams.index(team_id)
+        if i is None:
+            return []
+        return [self._row(self.athletes, a, "athlete_id", ("name", "sex"))
+                for a in self._slice(self.team_athlete_off, self.team_athlete_idx, i)]
+
+    def team_medals(self, team_id):
+        i = self.teams.index(team_id)
+        if i is None:
+            return []
+        counts = self.team_medal_counts[i]
+        rows = [{"medal": self.medals[m] or "No medal", "count": int(c)}
+                for m, c in enumerate(counts) if c]
+        return sorted(rows, key=lambda r: (-r["count"], r["medal"]))
+
+    # -------- SPORT / OLYMPICS --------
+    def sport(self, sport_id):
+        i = self.sports.index(sport_id)
+        return None if i is None else self._row(self.sports, i, "sport_id")
+
+    def sport_events(self, sport_id):
+        i = self.sports.index(sport_id)
+        if i is None:
+            return []
+        games = self.olympics.columns
+        rows = []
+        for e in self._slice(self.sport_event_off, self.sport_event_idx, i):
+            o = self.event_olympics[e]
+            rows.append({
+                "event_id": int(self.events.ids[e]),
+                "event_name": self.events.columns["name"][e],
+                "year": games["year"][o],
+                "season": games["season"][o],
+                "city": games["city"][o],
+                "olympics_id": int(self.olympics.ids[o]),
+            })
+        return rows
+
+    def olympics_record(self, olympics_id):
+        i = self.olympics.index(olympics_id)
+        return None if i is None else self._row(self.olympics, i, "olympics_id")
+
+    def olympics_events(self, olympics_id):
+        i = self.olympics.index(olympics_id)
+        if i is None:
+            return []
+        rows = []
+        for e in self._slice(self.olympics_event_off, self.olympics_event_idx, i):
+            s = self.event_sport[e]
+            rows.append({
+                "event_id": int(self.events.ids[e]),
+                "event_name": self.events.columns["name"][e],
+                "sport_id": int(self.sports.ids[s]),
+                "sport": self.sports.columns["name"][s],
+            })
+        return rows
+
+    # -------- EVENT --------
+    def event(self, event_id):
+        e = self.events.index(event_id)
+        if e is None:
+            return None
+        s, o = self.event_sport[e], self.event_olympics[e]
+        games = self.olympics.columns
+        return {
+            "event_id": int(self.events.ids[e]),
+            "event_name": self.events.columns["name"][e],
+            "sport": self.sports.columns["name"][s],
+            "games_name": games["name"][o],
+            "year": games["year"][o],
+            "season": games["season"][o],
+            "city": games["city"][o],
+        }
+
+    def event_medalists(self, event_id):
+        e = self.events.index(event_id)
+        if e is None:
+            return []
+        athletes = self.athletes.columns
+        rows = []
+        for p in self._slice(self.event_part_off, self.event_part_idx, e):
+            a, t = self.pi_athlete[p], self.pi_team[p]
+            rows.append({
+                "athlete_id": int(self.athletes.ids[a]),
+                "athlete_name": athletes["name"][a],
+                "sex": athletes["sex"][a],
+                "team_id": None if t < 0 else int(self.teams.ids[t]),
+                "team": None if t < 0 else self.teams.columns["name"][t],
+                "medal": self.medals[self.pi_medal[p]],
+            })
+        return rows
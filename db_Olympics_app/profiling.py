@@ -0,0 +1,243 @@
+"""
+On-demand sampling profiler for single requests.
+
+A request is profiled when it carries the configured token (`X-Profile`
+header or `?profile=` argument) or is picked at random with probability
+PROFILE_RATE. A sampler thread then records the Python stack of the
+request's thread every INTERVAL seconds until the request ends. Unprofiled
+requests only pay for the header and argument lookups.
+
+Every profile keeps
+  - the stacks in collapsed format ("frame;frame;frame count" per line),
+    which flamegraph.pl and speedscope turn into a flame graph, and
+  - the request time split into buckets by what the request thread was
+    doing when sampled:
+      sql       inside a SQLite call (execute / fetch*)
+      template  rendering a Jinja template
+      view      other Python in the view: row conversion, link()/url_for
+      other     Flask dispatch, hooks, admission, compression
+
+The last KEEP profiles are served by id at /_profile/<id> (JSON summary)
+and /_profile/<id>/collapsed to holders of the token; the id is sent back
+in the X-Profile-Id response header.
+"""
+import collections
+import linecache
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+INTERVAL = float(os.environ.get("OLYMPICS_PROFILE_INTERVAL", 0.001))
+KEEP = int(os.environ.get("OLYMPICS_PROFILE_KEEP", 50))
+BUCKETS = ("sql", "template", "view", "other")
+
+# A sampled line calling into the sqlite3 C module, or iterating a cursor
+SQLITE_CALL_RE = re.compile(
+    r"\.(execute|executemany|executescript|fetchone|fetchmany|fetchall)\(|\bfor\b.*\bin\s+cursor\b")
+# Functions whose time is spent waiting for SQLite in other threads
+SQL_FANOUT = {"db.py:shard_map"}
+
+_profiles = collections.OrderedDict()
+_lock = threading.Lock()
+_active = 0
+_switch_interval = None
+
+
+def _template_frame(code):
+    return "jinja2" in code.co_filename or (
+        code.co_name.startswith("render") and code.co_filename.endswith(os.path.join("flask", "templating.py")))
+
+
+def _label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class Sampler(threading.Thread):
+    """Samples the stack of one thread until stop() is called."""
+
+    def __init__(self, thread_id, view_code=None, interval=INTERVAL):
+        super().__init__(name="profiler", daemon=True)
+        self.thread_id = thread_id
+        self.view_code = view_code
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.buckets = collections.Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.sample(frame)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def sample(self, frame):
+        innermost = frame
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        # Drop the server / thread frames above the WSGI entry point
+        for start, code in enumerate(codes):
+            if code.co_name == "wsgi_app":
+                codes = codes[start:]
+                break
+        self.stacks[";".join(_label(code) for code in codes)] += 1
+        self.buckets[self.classify(innermost, codes)] += 1
+
+    def classify(self, innermost, codes):
+        lineno = innermost.f_lineno
+        line = linecache.getline(innermost.f_code.co_filename, lineno) if lineno else ""
+        if SQLITE_CALL_RE.search(line) or any(_label(code) in SQL_FANOUT for code in codes):
+            return "sql"
+        if any(_template_frame(code) for code in codes):
+            return "template"
+        if self.view_code is not None and self.view_code in codes:
+            return "view"
+        return "other"
+
+
+def _begin_sampling():
+    # Python threads only switch every sys.getswitchinterval() (5 ms): lower
+    # it while a profile runs so the sampler gets to run on time
+    global _active, _switch_interval
+    with _lock:
+        if _active == 0:
+            _switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(_switch_interval, INTERVAL / 2))
+        _active += 1
+
+
+def _end_sampling():
+    global _active
+    with _lock:
+        _active -= 1
+        if _active == 0:
+            sys.setswitchinterval(_switch_interval)
+
+
+def _store(profile):
+    with _lock:
+        _profiles[profile["id"]] = profile
+        while len(_profiles) > KEEP:
+            _profiles.popitem(last=False)
+
+
+def get(profile_id):
+    return _profiles.get(profile_id)
+
+
+def recent():
+    """Summaries of the kept profiles, newest first."""
+    with _lock:
+        profiles = list(_profiles.values())
+    return [{k: v for k, v in p.items() if k != "stacks"} for p in reversed(profiles)]
+
+
+def collapsed(profile):
+    """The profile's stacks as collapsed text for flamegraph.pl / speedscope."""
+    return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].most_common())
+
+
+def init_app(app):
+    """
+    Register the profiling hooks and the /_profile/ routes on `app`.
+    Profiles are requested with app.config["PROFILE_TOKEN"] and sampled with
+    app.config["PROFILE_RATE"]; the routes need the token and are closed
+    when none is set (sampled profiles are then only logged).
+    """
+    from flask import abort, g, jsonify, request
+
+    def wanted():
+        token = app.config.get("PROFILE_TOKEN")
+        if token and token in (request.headers.get("X-Profile"), request.args.get("profile")):
+            return True
+        rate = app.config.get("PROFILE_RATE", 0)
+        return rate > 0 and random.random() < rate
+
+    def authorized():
+        # No token, no access: behind a reverse proxy every client looks
+        # local, and profiles show stacks and query strings (custom SQL)
+        token = app.config.get("PROFILE_TOKEN")
+        return bool(token) and token in (request.headers.get("X-Profile"), request.args.get("profile"))
+
+    @app.before_request
+    def start_profile():
+        if request.endpoint in (None, "static", "profile_summary", "profile_collapsed"):
+            return
+        if not wanted():
+            return
+        view = app.view_functions.get(request.endpoint)
+        _begin_sampling()
+        sampler = Sampler(threading.get_ident(), getattr(view, "__code__", None))
+        g.profile = (uuid.uuid4().hex[:12], sampler, time.perf_counter())
+        sampler.start()
+
+    @app.after_request
+    def tag_profile(response):
+        profile = g.get("profile")
+        if profile is not None:
+            response.headers["X-Profile-Id"] = profile[0]
+        return response
+
+    @app.teardown_request
+    def finish_profile(exc=None):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return
+        profile_id, sampler, start = profile
+        seconds = time.perf_counter() - start
+        sampler.stop()
+        _end_sampling()
+        samples = sum(sampler.buckets.values())
+        breakdown = {
+            bucket: round(seconds * sampler.buckets[bucket] / samples, 6) if samples else 0.0
+            for bucket in BUCKETS
+        }
+        _store({
+            "id": profile_id,
+            "path": request.full_path.rstrip("?"),
+            "endpoint": request.endpoint,
+            "started": time.time() - seconds,
+            "seconds": round(seconds, 6),
+            "samples": samples,
+            "interval": sampler.interval,
+            "breakdown": breakdown,
+            "stacks": sampler.stacks,
+        })
+        logging.info(
+            f"Profile {profile_id} {request.path}: {seconds * 1000:.1f} ms, "
+            + ", ".join(f"{b} {breakdown[b] * 1000:.1f} ms" for b in BUCKETS)
+        )
+
+    @app.route("/_profile/")
+    @app.route("/_profile/<profile_id>")
+    def profile_summary(profile_id=None):
+        if not authorized():
+            abort(403)
+        if profile_id is None:
+            return jsonify(recent())
+        profile = get(profile_id)
+        if profile is None:
+            abort(404)
+        summary = {k: v for k, v in profile.items() if k != "stacks"}
+        summary["top_stacks"] = profile["stacks"].most_common(20)
+        return jsonify(summary)
+
+    @app.route("/_profile/<profile_id>/collapsed")
+    def profile_collapsed(profile_id):
+        if not authorized():
+            abort(403)
+        profile = get(profile_id)
+        if profile is None:
+            abort(404)
+        return collapsed(profile), 200, {"Content-Type": "text/plain; charset=utf-8"}
@@ -0,0 +1,134 @@
+"""
+Registry of the canned questions in questions/*.sql.
+
+Each file is read and parsed once; the request path only does dict lookups.
+A file starts with `-- key: value` header lines:
+
+    -- title: Total number of athletes stored.
+    -- columns: athlete_count
+    -- params: year            (optional, bound as :year)
+
+The statement text is normalised once (comments dropped, whitespace outside
+string literals collapsed) and always passed to SQLite verbatim, so each
+connection's statement cache (keyed on the SQL text) reuses the prepared
+statement instead of recompiling it.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+from db import compact_sql
+
+HEADER_RE = re.compile(r'^--\s*(\w+)\s*:\s*(.*?)\s*$')
+
+
+class Question:
+    """One parsed questions/<number>.sql file."""
+
+    __slots__ = ("number", "filename", "title", "columns", "params", "query", "sql")
+
+    def __init__(self, number, filename, text):
+        self.number = number
+        self.filename = filename
+        header = {}
+        lines = text.splitlines()
+        while lines and (match := HEADER_RE.match(lines[0])):
+            header[match.group(1).lower()] = match.group(2)
+            lines.pop(0)
+        self.title = header.get("title", "Question without description")
+        self.columns = _split(header.get("columns"))
+        self.params = _split(header.get("params"))
+        # `query` is what the result page shows, `sql` is what SQLite runs
+        self.query = "\n".join(lines).strip() + "\n"
+        self.sql = compact_sql(self.query)
+
+    def bind(self, values):
+        """Named parameters for this question from a mapping (e.g. request.args)."""
+        return {name: values.get(name) for name in self.params}
+
+
+def _split(value):
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+
+class QuestionRegistry:
+    """All questions, keyed by number, reloadable as one atomic swap."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._questions = {}
+        self._stamp = None
+        # Bumped on every reload, so caches can key on it
+        self.generation = 0
+        # Hash of every statement, for caches that outlive the process
+        self.digest = None
+        self.reload()
+
+    def _scan(self):
+        """Filename -> mtime for every questions/<number>.sql file."""
+        return {
+            entry.name: entry.stat().st_mtime_ns
+            for entry in os.scandir(self.folder)
+            if entry.name.endswith('.sql') and entry.name[:-4].isdigit()
+        }
+
+    def reload(self):
+        stamp = self._scan()
+        questions = {}
+        for filename in stamp:
+            with open(os.path.join(self.folder, filename)) as sql_file:
+                question = Question(int(filename[:-4]), filename, sql_file.read())
+            questions[question.number] = question
+        self._questions = dict(sorted(questions.items()))
+        self.digest = hashlib.sha1(
+            "\0".join(f"{q.number}:{q.sql}" for q in self._questions.values()).encode()
+        ).hexdigest()
+        self._stamp = stamp
+        self.generation += 1
+        logging.info(f"Loaded {len(questions)} questions from {self.folder}")
+
+    def get(self, number):
+        return self._questions.get(number)
+
+    def all(self):
+        return list(self._questions.values())
+
+    def validate(self, conn):
+        """
+        Compile every question against `conn` and compare its result columns
+        with the `-- columns:` header. Returns a list of problem strings.
+        """
+        problems = []
+        for q in self.all():
+            try:
+                cursor = conn.execute(
+                    f"SELECT * FROM ({q.sql.rstrip(';')}) LIMIT 0",
+                    {name: None for name in q.params},
+                )
+                columns = [d[0] for d in cursor.description]
+            except Exception as exc:
+                problems.append(f"{q.filename}: {exc}")
+                continue
+            if q.columns and columns != q.columns:
+                problems.append(f"{q.filename}: returns {columns}, header says {q.columns}")
+        for problem in problems:
+            logging.warning(f"Question check failed: {problem}")
+        return problems
+
+    def watch(self, interval=2.0):
+        """Poll the folder in a daemon thread and reload when files change."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self._scan() != self._stamp:
+                        self.reload()
+                except Exception:
+                    logging.exception("Reloading questions failed")
+
+        thread = threading.Thread(target=loop, name="question-watcher", daemon=True)
+        thread.start()
+        return thread
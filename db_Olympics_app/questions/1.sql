@@ -1,2 +1,4 @@
+-- title: Total number of athletes stored.
+-- columns: athlete_count
 SELECT COUNT(*) AS athlete_count
 FROM ATHLETE;
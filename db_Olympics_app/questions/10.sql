@@ -1,3 +1,5 @@
+-- title: Olympic host cities ordered by number of events held.
+-- columns: city, season, year, event_count
 SELECT
   o.city,
   o.season,
@@ -1,3 +1,5 @@
+-- title: Average medalist age by sport (where age is known).
+-- columns: sport, avg_age, medalists_with_age
 SELECT
   s.name AS sport,
   ROUND(AVG(pi.age), 2) AS avg_age,
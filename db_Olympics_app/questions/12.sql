@@ -1,3 +1,5 @@
+-- title: Medalist counts per Olympic games (top 10).
+-- columns: olympics_id, games_name, year, season, city, medalists
 SELECT
   o.olympics_id,
   o.name AS games_name,
@@ -1,3 +1,5 @@
+-- title: How many events exist for each sport?
+-- columns: sport_id, sport, event_count
 SELECT
   s.sport_id,
   s.name AS sport,
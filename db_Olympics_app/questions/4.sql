@@ -1,3 +1,5 @@
+-- title: Average athlete height and weight grouped by sex.
+-- columns: sex, avg_height, avg_weight, athletes
 SELECT
   sex,
   ROUND(AVG(height), 2) AS avg_height,
@@ -1,3 +1,5 @@
+-- title: Cities that have hosted the Olympics and how many times.
+-- columns: city, editions
 SELECT
   city,
   COUNT(*) AS editions
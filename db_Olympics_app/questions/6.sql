@@ -1,3 +1,5 @@
+-- title: Events with the largest number of medalists (top 10).
+-- columns: event_id, event_name, sport, year, season, city, medalists
 SELECT
   e.event_id,
   e.name AS event_name,
@@ -1,3 +1,5 @@
+-- title: Medal breakdown by sport (gold/silver/bronze).
+-- columns: sport, golds, silvers, bronzes, total_medals
 SELECT
   s.name AS sport,
   SUM(CASE WHEN pi.medal = 'Gold' THEN 1 ELSE 0 END)   AS golds,
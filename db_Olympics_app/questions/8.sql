@@ -1,3 +1,5 @@
+-- title: Athletes with the highest medal counts (top 10).
+-- columns: athlete_id, athlete_name, medals
 SELECT
   a.athlete_id,
   a.name AS athlete_name,
@@ -0,0 +1,21 @@
+-- question: 353c646083ea
+-- AVG is split into a sum and a count per shard.
+-- partial
+SELECT
+  e.sport_id,
+  SUM(pi.age) AS age_sum,
+  COUNT(*) AS n
+FROM PARTICIPATED_IN pi
+JOIN EVENT e ON e.event_id = pi.event_id
+WHERE pi.age IS NOT NULL
+GROUP BY e.sport_id;
+-- merge
+SELECT
+  s.name AS sport,
+  ROUND(SUM(p.age_sum) * 1.0 / SUM(p.n), 2) AS avg_age,
+  SUM(p.n) AS medalists_with_age
+FROM partial p
+JOIN SPORT s ON s.sport_id = p.sport_id
+GROUP BY s.name
+HAVING medalists_with_age > 0
+ORDER BY avg_age ASC, sport;
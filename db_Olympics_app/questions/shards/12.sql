@@ -0,0 +1,21 @@
+-- question: 1bf4cf1b074c
+-- partial
+SELECT
+  e.olympics_id,
+  COUNT(pi.athlete_id) AS medalists
+FROM EVENT e
+JOIN PARTICIPATED_IN pi ON pi.event_id = e.event_id
+GROUP BY e.olympics_id;
+-- merge
+SELECT
+  o.olympics_id,
+  o.name AS games_name,
+  o.year,
+  o.season,
+  o.city,
+  SUM(p.medalists) AS medalists
+FROM OLYMPICS o
+JOIN partial p ON p.olympics_id = o.olympics_id
+GROUP BY o.olympics_id, o.name, o.year, o.season, o.city
+ORDER BY medalists DESC, o.year
+LIMIT 10;
@@ -0,0 +1,6 @@
+-- question: 07a2928fbc95
+-- Every event lives in exactly one shard, so each shard's top 10 by
+-- medalists is final: questions/6.sql itself runs on every shard and the
+-- merge keeps the overall top 10.
+-- merge
+SELECT * FROM partial ORDER BY medalists DESC, event_name LIMIT 10;
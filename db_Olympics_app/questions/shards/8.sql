@@ -0,0 +1,18 @@
+-- question: 593fefcdf454
+-- partial
+SELECT
+  pi.athlete_id,
+  SUM(CASE WHEN pi.medal IS NOT NULL AND pi.medal <> 'NA' THEN 1 ELSE 0 END) AS medals
+FROM PARTICIPATED_IN pi
+GROUP BY pi.athlete_id
+HAVING medals > 0;
+-- merge
+SELECT
+  a.athlete_id,
+  a.name AS athlete_name,
+  SUM(p.medals) AS medals
+FROM partial p
+JOIN ATHLETE a ON a.athlete_id = p.athlete_id
+GROUP BY a.athlete_id, a.name
+ORDER BY medals DESC, athlete_name
+LIMIT 10;
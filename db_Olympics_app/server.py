@@ -1,12 +1,27 @@
 #! /usr/bin/python3
 import logging
-from app import APP
+from app import APP, QUESTIONS, columnar_engine, entity_graph, facet_index, fuzzy_index, sharded_engine
 import db
+import warmup
 
 if __name__ == '__main__':
   logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s',
                     datefmt='%Y-%m-%d %H:%M:%S')
-  db.connect()
+  db.connect(APP.config["DB_MODE"])
+  QUESTIONS.validate(db.DB['conn'])
+  if db.VERSION_POLL > 0:
+    # Swap and warm up as soon as db_create.py publishes, not on the next request
+    db.watch_version()
+  if APP.config["QUESTIONS_WATCH"]:
+    QUESTIONS.watch()
+  # Load the optional in-memory structures before serving
+  entity_graph()
+  columnar_engine()
+  sharded_engine()
+  facet_index()
+  fuzzy_index()
+  if APP.config["WARMUP"]:
+    warmup.start(APP)
   APP.run(host='0.0.0.0', port=9000)
 
@@ -0,0 +1,129 @@
+"""
+Fan-out execution of the aggregate questions over the Games shards.
+
+db_create.py can write EVENT and PARTICIPATED_IN a second time, split into
+one SQLite file per Games (or per decade). A question that scans the fact
+table is then run as a partial aggregate on every shard (db.shard_map,
+in a thread pool) and the partial rows are merged by a second query that
+joins the dimension tables.
+
+The partial and merge SQL of question <n> live in questions/shards/<n>.sql,
+next to the question itself:
+
+    -- question: <digest of questions/<n>.sql, see question_digest()>
+    -- partial
+    SELECT ... per shard ...
+    -- merge
+    SELECT ... FROM partial ...
+
+Without a `-- partial` section the question runs unchanged on every shard.
+A split written for another version of its question is skipped, so editing
+a question turns its fan-out off until the split is updated. Like the
+columnar engine, every routed question is also checked against SQLite when
+the engine is built and dropped if the merged result differs.
+"""
+import hashlib
+import logging
+import os
+import re
+
+import db
+from question_registry import HEADER_RE
+
+SPLIT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions", "shards")
+SECTION_RE = re.compile(r"^--\s*(partial|merge)\s*$")
+
+
+def question_digest(question):
+    """Short hash of a question's statement, as named by its split file."""
+    return hashlib.sha1(question.sql.encode()).hexdigest()[:12]
+
+
+def parse_split(text):
+    """({header key: value}, {"partial"/"merge": SQL}) of one split file."""
+    header, sections, current = {}, {}, None
+    for line in text.splitlines():
+        if match := SECTION_RE.match(line):
+            current = match.group(1)
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+        elif match := HEADER_RE.match(line):
+            header[match.group(1).lower()] = match.group(2)
+    return header, {name: "\n".join(lines).strip().rstrip(";") for name, lines in sections.items()}
+
+
+def load_splits(questions, folder=SPLIT_FOLDER):
+    """
+    {number: (partial SQL, merge SQL)} for every split in `folder` whose
+    question exists in the registry `questions` and is unchanged since.
+    """
+    splits = {}
+    for entry in sorted(os.scandir(folder), key=lambda e: e.name) if os.path.isdir(folder) else []:
+        if not (entry.name.endswith(".sql") and entry.name[:-4].isdigit()):
+            continue
+        number = int(entry.name[:-4])
+        question = questions.get(number)
+        if question is None:
+            continue
+        with open(entry.path) as f:
+            header, sections = parse_split(f.read())
+        if header.get("question") != question_digest(question):
+            logging.warning(
+                f"questions/{number}.sql changed since questions/shards/{entry.name} was written "
+                f"(digest {question_digest(question)}); question {number} is not fanned out")
+            continue
+        splits[number] = (sections.get("partial") or question.sql.rstrip(";"), sections["merge"])
+    return splits
+
+
+def merge(columns, parts, merge_sql, mode=None):
+    """Load the partial rows into a scratch table and run merge_sql over them."""
+    conn = db.open_with_dims(":memory:", mode)
+    try:
+        conn.execute(f"CREATE TABLE partial({', '.join(columns)});")
+        placeholders = ", ".join("?" for _ in columns)
+        for rows in parts:
+            conn.executemany(f"INSERT INTO partial VALUES ({placeholders});", rows)
+        cursor = conn.execute(merge_sql)
+        return [d[0] for d in cursor.description], [tuple(r) for r in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+class ShardedEngine:
+    """The fan-out questions for one shard layout (see db.shard_layout)."""
+
+    def __init__(self, layout, questions, workers=None, mode=None):
+        self.paths = [shard["path"] for shard in layout["shards"]]
+        self.workers = workers
+        self.mode = mode
+        self.queries = load_splits(questions)
+
+    def supports(self, number):
+        return number in self.queries
+
+    def run(self, number, workers=None):
+        """Return (columns, rows) for question `number`."""
+        partial_sql, merge_sql = self.queries[number]
+        columns, parts = db.shard_map(
+            partial_sql, paths=self.paths, workers=workers or self.workers, mode=self.mode)
+        return merge(columns, parts, merge_sql, self.mode)
+
+    def verify(self, conn, sql_by_number):
+        """
+        Compare every supported question with SQLite and drop the ones that
+        differ. Returns the list of question numbers that were dropped.
+        """
+        dropped = []
+        for number in list(self.queries):
+            if number not in sql_by_number:
+                del self.queries[number]
+                continue
+            cursor = conn.execute(sql_by_number[number])
+            expected = ([d[0] for d in cursor.description], [tuple(r) for r in cursor.fetchall()])
+            if self.run(number) != expected:
+                logging.warning(f"Sharded result for question {number} differs from SQLite; disabled")
+                del self.queries[number]
+                dropped.append(number)
+        return dropped
@@ -0,0 +1,264 @@
+"""
+Versioned on-disk snapshots of the in-memory structures (graph, columnar,
+facets, fuzzy).
+
+A snapshot is a folder next to the database,
+
+    Olympics.db.snapshot-<version>/<name>/manifest.json + *.npy
+
+holding every NumPy array of the object as its own .npy file and the object
+layout (classes, small scalars, lists) as JSON; nothing is pickled. Workers
+attach with np.load(mmap_mode="r"), which takes milliseconds and maps the
+same page-cache pages in every process instead of each building a copy.
+
+When no snapshot exists for the current version (a new import, or the
+first start), get() returns None, the caller falls back to SQL, and one
+background thread per version builds the object and writes the snapshot.
+Until it is attached, get() answers None without the lock or the disk. A
+lock file keeps several workers from building the same one: the others
+wait for the lock to go and attach the result. A build that returns None
+(e.g. an index that failed its check against SQLite) is written as such,
+and the object stays disabled for that version. A build that raises is
+retried after a back-off that doubles with every failure.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+import db
+
+FORMAT = 1
+SUFFIX = ".snapshot-"
+LOCK_TIMEOUT = 15 * 60   # a build lock older than this is from a dead process
+LOCK_POLL = 0.5          # seconds between checks of another worker's build lock
+RETRY_DELAY = 30         # seconds before a failed build is retried, doubled per failure
+RETRY_MAX_DELAY = 30 * 60
+
+# Attached in place of an object whose build returned None
+DISABLED = object()
+
+_attached = {}
+_building = set()   # (name, version) keys with a build thread running
+_failed = {}        # (name, version) -> (failures, monotonic time of the next retry)
+_lock = threading.Lock()
+
+
+def _classes():
+    """Classes a snapshot may contain, by name."""
+    import columnar
+    import facets
+    import fuzzy
+    import graph
+    return {cls.__name__: cls for cls in (
+        graph.StringColumn, graph.NumberColumn, graph.Table, graph.EntityGraph,
+        columnar.ColumnarEngine, facets.FacetDimension, facets.FacetIndex,
+        fuzzy.FuzzyIndex)}
+
+
+def snapshot_dir(version):
+    return db.DB_FILE + SUFFIX + version
+
+
+def _state(obj):
+    if "__getstate__" in type(obj).__dict__:
+        return obj.__getstate__()
+    if hasattr(type(obj), "__slots__"):
+        return {name: getattr(obj, name) for name in type(obj).__slots__}
+    return dict(vars(obj))
+
+
+def _encode(value, folder, name, classes):
+    """JSON spec for `value`; arrays are written to `folder` as <name>.npy."""
+    if isinstance(value, np.ndarray):
+        if value.size == 0:  # a zero-length file cannot be mapped
+            return {"empty": value.dtype.str, "shape": list(value.shape)}
+        filename = f"{name}.npy"
+        np.save(os.path.join(folder, filename), np.ascontiguousarray(value), allow_pickle=False)
+        return {"npy": filename}
+    if classes.get(type(value).__name__) is type(value):
+        return {"class": type(value).__name__, "state": {
+            key: _encode(item, folder, f"{name}.{key}", classes)
+            for key, item in _state(value).items()}}
+    if isinstance(value, dict):
+        return {"dict": [[key, _encode(item, folder, f"{name}.{key}", classes)]
+                         for key, item in value.items()]}
+    if isinstance(value, np.generic):
+        return {"json": value.item()}
+    if value is None or isinstance(value, (bool, int, float, str, list, tuple)):
+        return {"json": value}
+    raise TypeError(f"cannot snapshot {name}: {type(value).__name__}")
+
+
+def _decode(spec, folder, classes):
+    if "npy" in spec:
+        return np.load(os.path.join(folder, spec["npy"]), mmap_mode="r", allow_pickle=False)
+    if "empty" in spec:
+        return np.empty(spec["shape"], dtype=spec["empty"])
+    if "class" in spec:
+        cls = classes[spec["class"]]
+        obj = cls.__new__(cls)
+        state = {key: _decode(item, folder, classes) for key, item in spec["state"].items()}
+        if "__setstate__" in cls.__dict__:
+            obj.__setstate__(state)
+        else:
+            for key, item in state.items():
+                setattr(obj, key, item)
+        return obj
+    if "dict" in spec:
+        return {key: _decode(item, folder, classes) for key, item in spec["dict"]}
+    return spec["json"]
+
+
+def write(obj, name, version):
+    """Write `obj` as snapshot `name` of `version`; the folder appears atomically."""
+    folder = os.path.join(snapshot_dir(version), name)
+    tmp_folder = f"{folder}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    root = _encode(obj, tmp_folder, name, _classes())
+    manifest = {"format": FORMAT, "version": version, "name": name, "root": root}
+    with open(os.path.join(tmp_folder, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp_folder, folder)
+    return folder
+
+
+def load(name, version):
+    """
+    Attach snapshot `name` of `version` (arrays memory-mapped); None when it
+    does not exist, DISABLED when its build returned None.
+    """
+    folder = os.path.join(snapshot_dir(version), name)
+    try:
+        with open(os.path.join(folder, "manifest.json")) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get("format") != FORMAT or manifest.get("version") != version:
+        return None
+    obj = _decode(manifest["root"], folder, _classes())
+    return DISABLED if obj is None else obj
+
+
+def prune(keep):
+    """Remove the snapshots of every version but `keep`."""
+    prefix = db.DB_FILE + SUFFIX
+    parent = os.path.dirname(prefix)
+    for entry in os.scandir(parent):
+        if entry.path.startswith(prefix) and entry.path != prefix + keep:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _lock_is_stale(lock_path):
+    try:
+        return time.time() - os.stat(lock_path).st_mtime > LOCK_TIMEOUT
+    except FileNotFoundError:
+        return False
+
+
+def _build(name, build, version):
+    """Build and write snapshot `name` of `version`, or wait for the worker that is building it."""
+    folder = snapshot_dir(version)
+    os.makedirs(folder, exist_ok=True)
+    lock_path = os.path.join(folder, f"{name}.lock")
+    if _lock_is_stale(lock_path):
+        os.remove(lock_path)
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        # Another worker is building it: attach once its lock is gone
+        while (os.path.exists(lock_path) and not _lock_is_stale(lock_path)
+               and db.current_version() == version):
+            time.sleep(LOCK_POLL)
+    else:
+        try:
+            start = time.perf_counter()
+            obj = build()
+            if db.current_version() != version:
+                logging.info(f"Snapshot {name} of version {version} is already stale; not written")
+                return
+            write(obj, name, version)
+            if obj is None:
+                logging.info(f"Snapshot {name} is disabled for version {version}: its build returned None")
+            else:
+                logging.info(f"Wrote snapshot {name} of version {version} in {time.perf_counter() - start:.2f} s")
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+        if db.current_version() == version:
+            prune(version)
+    obj = load(name, version)
+    if obj is None:
+        raise RuntimeError(f"no snapshot {name} of version {version} after the build")
+    with _lock:
+        _attached[(name, version)] = obj
+
+
+def get(name, build, version=None):
+    """
+    The object `name` for the served database version, attached from its
+    snapshot; None while the snapshot is being (re)built in the background,
+    after a failed build until its retry is due, or when the build returned
+    None for this version.
+    """
+    version = version or db.DB.get('version') or db.current_version()
+    key = (name, version)
+    obj = _attached.get(key)
+    if obj is None and (key in _building or _failed.get(key, (0, 0))[1] > time.monotonic()):
+        # Requests go to SQL without the lock or the disk
+        return None
+    if obj is None:
+        obj = _attach_or_build(name, build, version)
+    return None if obj is DISABLED else obj
+
+
+def _attach_or_build(name, build, version):
+    key = (name, version)
+    with _lock:
+        obj = _attached.get(key)
+        if (obj is None and key not in _building
+                and _failed.get(key, (0, 0))[1] <= time.monotonic()):
+            start = time.perf_counter()
+            try:
+                obj = load(name, version)
+            except Exception:
+                logging.exception(f"Snapshot {name} of version {version} is unreadable; rebuilding")
+            if obj is not None:
+                _attached[key] = obj
+                logging.info(f"Attached snapshot {name} in {(time.perf_counter() - start) * 1000:.1f} ms")
+            elif version == db.current_version():
+                # Stale or missing: one build per process and version at a time
+                _building.add(key)
+                threading.Thread(target=_run_build, args=(name, build, version),
+                                 name=f"snapshot-{name}", daemon=True).start()
+    return obj
+
+
+def _run_build(name, build, version):
+    key = (name, version)
+    try:
+        _build(name, build, version)
+        _failed.pop(key, None)
+    except Exception:
+        failures = _failed.get(key, (0, 0))[0] + 1
+        delay = min(RETRY_DELAY * 2 ** (failures - 1), RETRY_MAX_DELAY)
+        _failed[key] = (failures, time.monotonic() + delay)
+        logging.exception(
+            f"Building snapshot {name} of version {version} failed ({failures}x); retrying in {delay} s")
+    finally:
+        _building.discard(key)
+
+
+@db.on_new_version
+def _forget_old(version):
+    with _lock:
+        for key in [k for k in _attached if k[1] != version]:
+            del _attached[key]
+        for key in [k for k in _failed if k[1] != version]:
+            del _failed[key]
@@ -0,0 +1,324 @@
+"""
+Every optional engine against the SQL path it replaces, on a small synthetic
+database built with db_create.py's schema and import:
+
+    python -m pytest -q test_engines.py
+"""
+import importlib
+import os
+import random
+import sqlite3
+import sys
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BASE_DIR))
+db_create = pytest.importorskip("db_create", reason="db_create.py needs pandas")
+
+import db
+from question_registry import QuestionRegistry
+
+QUESTIONS = QuestionRegistry(os.path.join(BASE_DIR, "questions"))
+VERSION = "1"
+
+FIRST_NAMES = ["Anna", "Jean", "Piotr", "Mária", "Kenji", "Oluwaseun", "Zoë", "Carlos",
+               "Li", "Ingrid", "Mohamed", "Sofía", "Jan-Erik", "O'Brien"]
+LAST_NAMES = ["Nakamura", "Dubois", "Kowalski", "Van der Berg", "Okafor", "García Márquez",
+              "Andersson", "Smith", "Müller", "Rossi", "Ivanova", "Bjørnstad"]
+TEAMS = [("United States", "USA"), ("France", "FRA"), ("Japan", "JPN"), ("Great Britain", "GBR"),
+         ("Germany", "GER"), ("Nigeria", "NGR"), ("Soviet Union", "URS"), ("Norway", "NOR"),
+         ("United States-2", "USA")]
+SPORTS = {"Rowing": ["Single Sculls", "Eights"], "Judo": ["Half-Lightweight", "Heavyweight"],
+          "Athletics": ["100 metres", "Marathon", "High Jump"], "Swimming": ["200 metres Freestyle"],
+          "Cross Country Skiing": ["15 kilometres"], "Speed Skating": ["500 metres"]}
+WINTER_SPORTS = {"Cross Country Skiing", "Speed Skating"}
+GAMES = [(1896, "Summer", "Athina"), (1924, "Winter", "Chamonix"), (1936, "Summer", "Berlin"),
+         (1952, "Summer", "Helsinki"), (1952, "Winter", "Oslo"), (1964, "Summer", "Tokyo"),
+         (1992, "Summer", "Barcelona"), (1992, "Winter", "Albertville"), (2000, "Summer", "Sydney"),
+         (2016, "Summer", "Rio de Janeiro")]
+MEDALS = ["NA"] * 12 + ["Gold", "Silver", "Bronze"]
+
+FACET_FILTERS = [
+    {},
+    {"sex": ["F"]},
+    {"sport": ["Rowing", "Judo"], "medal": ["Gold", "Silver"]},
+    {"year": (1990, 2010), "season": ["Summer"]},
+    {"year": (None, 1950), "noc": ["USA", "FRA"], "sex": ["M"]},
+    {"medal": ["No medal"], "year": (2000, None)},
+    {"sport": ["No such sport"]},
+]
+
+
+def synthetic_rows(athletes=400, seed=7):
+    """Source rows as load_source() returns them, for `athletes` athletes."""
+    rng = random.Random(seed)
+    rows = []
+    for athlete_id in range(1, athletes + 1):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        sex = rng.choice("MF")
+        height = rng.choice([None, float(rng.randint(150, 205))])
+        weight = rng.choice([None, float(rng.randint(45, 120))])
+        teams = rng.sample(TEAMS, rng.choice([1, 1, 1, 2, 3]))
+        for _ in range(rng.randint(1, 12)):
+            year, season, city = rng.choice(GAMES)
+            sport = rng.choice([s for s in SPORTS if (s in WINTER_SPORTS) == (season == "Winter")])
+            team_name, noc = rng.choice(teams)
+            rows.append(db_create.SourceRow(
+                athlete_id=athlete_id, athlete_name=name, sex=sex, height=height, weight=weight,
+                team_id=None, team_name=team_name, noc=noc,
+                sport_id=None, sport_name=sport,
+                olympics_id=None, olympics_name=f"{year} {season}", year=year, season=season, city=city,
+                event_id=None,
+                event_name=f"{sport} {'Women' if sex == 'F' else 'Men'}'s {rng.choice(SPORTS[sport])}",
+                age=rng.choice([None, rng.randint(16, 40)]), medal=rng.choice(MEDALS),
+            ))
+    return rows
+
+
+@pytest.fixture(scope="module")
+def olympics_db(tmp_path_factory):
+    """Path of a synthetic Olympics.db with shards, served as version VERSION."""
+    path = str(tmp_path_factory.mktemp("olympics") / "Olympics.db")
+    connection = sqlite3.connect(path)
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA foreign_keys = ON;")
+    db_create.ensure_schema(cursor)
+    db_create.import_sheet(cursor, synthetic_rows())
+    connection.commit()
+    connection.close()
+    db_create.validate(path)
+    db_create.write_shards(path, path + db.SHARDS_SUFFIX + VERSION)
+    with open(path + ".version", "w") as f:
+        f.write(VERSION + "\n")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(db, "DB_FILE", path)
+        patch.setattr(db, "VERSION_FILE", path + ".version")
+        db.connect()
+        yield path
+        db.close()
+        db.DB.clear()
+
+
+@pytest.fixture
+def conn(olympics_db):
+    conn = sqlite3.connect(olympics_db)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+def sql_result(conn, number):
+    """(columns, rows) of question `number` straight from SQLite."""
+    cursor = conn.execute(QUESTIONS.get(number).sql)
+    return [d[0] for d in cursor.description], [tuple(r) for r in cursor.fetchall()]
+
+
+def sample_ids(conn, table, pk, count=15):
+    """The first and last ids of a table, and one that does not exist."""
+    ids = [r[0] for r in conn.execute(f"SELECT {pk} FROM {table} ORDER BY {pk} LIMIT ?;", (count,))]
+    ids += [r[0] for r in conn.execute(f"SELECT {pk} FROM {table} ORDER BY {pk} DESC LIMIT 3;")]
+    return ids + [0]
+
+
+# -------- graph --------
+
+def test_graph_pages_match_sql(olympics_db, conn):
+    from app import APP
+    APP.config.update(WARMUP=False, ADMISSION=False, SNAPSHOT=False)
+    client = APP.test_client()
+    pages = [f"/athletes/{i}/" for i in sample_ids(conn, "ATHLETE", "athlete_id")]
+    pages += [f"/teams/{i}/" for i in sample_ids(conn, "TEAM", "team_id")]
+    pages += [f"/sports/{i}/" for i in sample_ids(conn, "SPORT", "sport_id")]
+    pages += [f"/olympics/{i}/" for i in sample_ids(conn, "OLYMPICS", "olympics_id")]
+    pages += [f"/events/{i}/" for i in sample_ids(conn, "EVENT", "event_id")]
+    try:
+        for page in pages:
+            APP.config["ENTITY_GRAPH"] = False
+            via_sql = client.get(page)
+            APP.config["ENTITY_GRAPH"] = True
+            via_graph = client.get(page)
+            assert (via_graph.status_code, via_graph.data) == (via_sql.status_code, via_sql.data), page
+    finally:
+        APP.config["ENTITY_GRAPH"] = False
+
+
+# -------- columnar --------
+
+def check_columnar(engine, conn):
+    assert engine.queries
+    for number in engine.queries:
+        assert engine.run(number) == sql_result(conn, number), f"question {number}"
+
+
+def test_columnar_matches_sql(conn):
+    import columnar
+    check_columnar(columnar.ColumnarEngine(conn), conn)
+
+
+# -------- shards --------
+
+def test_shards_match_sql(conn):
+    import shards
+    engine = shards.ShardedEngine(db.shard_layout(), QUESTIONS)
+    assert engine.queries, "no split matches its question"
+    for number in engine.queries:
+        for workers in (1, 4):
+            assert engine.run(number, workers) == sql_result(conn, number), f"question {number}"
+
+
+# -------- facets --------
+
+def check_facets(index, conn):
+    import facets
+    for filters in FACET_FILTERS:
+        for offset in (0, facets.PAGE_SIZE, 10_000):
+            assert index.search(filters, offset) == facets.sql_search(conn, filters, offset), filters
+
+
+def test_facets_match_sql(conn):
+    import facets
+    index = facets.FacetIndex(conn)
+    assert index.verify(conn)
+    check_facets(index, conn)
+
+
+def test_facets_without_bitwise_count(conn, monkeypatch):
+    import facets
+    words = np.random.default_rng(0).integers(0, 2**63, size=(4, 9), dtype=np.uint64) | np.uint64(1 << 63)
+    expected = [[bin(int(w)).count("1") for w in row] for row in words]
+    assert facets.bitwise_count(words).tolist() == expected
+    # As on NumPy < 2.0
+    monkeypatch.delattr(np, "bitwise_count", raising=False)
+    importlib.reload(facets)
+    try:
+        assert facets.bitwise_count(words).tolist() == expected
+        assert facets.bitwise_count(words[:, 2:5]).tolist() == [row[2:5] for row in expected]
+        check_facets(facets.FacetIndex(conn), conn)
+    finally:
+        monkeypatch.undo()
+        importlib.reload(facets)
+
+
+# -------- fuzzy --------
+
+def check_fuzzy(indexes, conn):
+    for kind, (table, pk) in {"athletes": ("ATHLETE", "athlete_id"), "teams": ("TEAM", "team_id")}.items():
+        names = [r[0] for r in conn.execute(
+            f"SELECT name FROM {table} WHERE length(name) > 8 ORDER BY {pk} LIMIT 20;")]
+        assert names
+        for name in names:
+            exact = {r[0] for r in conn.execute(f"SELECT {pk} FROM {table} WHERE name = ?;", (name,))}
+            # Same names: exact matches may not all fit in the default 20
+            found = indexes[kind].search(name, limit=len(exact) + 20)
+            assert exact <= {i for i, _, distance in found if distance == 0}, name
+            # One letter dropped from the longest word is still found
+            word = max(name.split(), key=len)
+            typo = name.replace(word, word[:2] + word[3:], 1)
+            assert exact <= {i for i, _, _ in indexes[kind].search(typo, limit=len(exact) + 20)}, typo
+
+
+def test_fuzzy_finds_sql_names(conn):
+    import fuzzy
+    check_fuzzy(fuzzy.build(conn), conn)
+
+
+# -------- snapshots --------
+
+def test_snapshots_match_sql(olympics_db, conn):
+    import columnar
+    import facets
+    import fuzzy
+    import graph
+    import snapshot
+    built = {
+        "graph": graph.EntityGraph(conn),
+        "columnar": columnar.ColumnarEngine(conn),
+        "facets": facets.FacetIndex(conn),
+        "fuzzy": fuzzy.build(conn),
+    }
+    attached = {}
+    for name, obj in built.items():
+        snapshot.write(obj, name, VERSION)
+        attached[name] = snapshot.load(name, VERSION)
+    check_columnar(attached["columnar"], conn)
+    check_facets(attached["facets"], conn)
+    check_fuzzy(attached["fuzzy"], conn)
+    for athlete_id in sample_ids(conn, "ATHLETE", "athlete_id"):
+        for method in ("athlete", "athlete_teams", "athlete_participations"):
+            assert (getattr(attached["graph"], method)(athlete_id)
+                    == getattr(built["graph"], method)(athlete_id)), (method, athlete_id)
+
+
+def test_snapshot_builds_are_not_repeated(olympics_db):
+    import snapshot
+    calls = {"none": 0, "raise": 0}
+
+    def build_none():
+        calls["none"] += 1
+
+    def build_raise():
+        calls["raise"] += 1
+        raise ValueError("broken build")
+
+    for _ in range(20):
+        assert snapshot.get("test-none", build_none, VERSION) is None
+        assert snapshot.get("test-raise", build_raise, VERSION) is None
+        for thread in threading.enumerate():
+            if thread.name.startswith("snapshot-test"):
+                thread.join()
+    # A None build disables the object for the version; a failure backs off
+    assert calls == {"none": 1, "raise": 1}
+    snapshot._attached.pop(("test-none", VERSION))
+    assert snapshot.get("test-none", build_none, VERSION) is None
+    assert calls["none"] == 1
+
+
+# -------- publishing --------
+
+def test_publish_keeps_versions_apart(tmp_path, monkeypatch):
+    path = str(tmp_path / "Olympics.db")
+
+    def build(value):
+        build_path = f"{path}.build-{value}"
+        connection = sqlite3.connect(build_path)
+        connection.execute("CREATE TABLE T (value TEXT);")
+        connection.execute("INSERT INTO T VALUES (?);", (value,))
+        connection.commit()
+        connection.close()
+        return build_path
+
+    def read(file):
+        connection = sqlite3.connect(file)
+        try:
+            return connection.execute("SELECT value FROM T;").fetchone()[0]
+        finally:
+            connection.close()
+
+    # Published before data files existed: the old file stays readable as version 1
+    os.replace(build("old"), path)
+    db_create.write_atomic(path + ".version", "1\n")
+    db_create.publish(build("new"), path, "2", previous="1")
+    monkeypatch.setattr(db, "DB_FILE", path)
+    assert db_create.read_version(path) == "2"
+    assert (read(db.data_file("1")), read(db.data_file("2")), read(path)) == ("old", "new", "new")
+    db_create.prune_versions(path, {"2"})
+    assert not os.path.exists(path + ".data-1")
+
+
+# -------- questions --------
+
+def test_question_comments_and_literals():
+    from question_registry import Question
+    question = Question(99, "99.sql", (
+        "-- title: Comments in the body\n"
+        "-- params: sport\n"
+        "SELECT name   -- display name\n"
+        "FROM SPORT /* every sport\n   is listed */\n"
+        "WHERE name <> 'a -- b  /* c */' AND name = :sport;\n"))
+    assert (question.title, question.params) == ("Comments in the body", ["sport"])
+    assert question.sql == "SELECT name FROM SPORT WHERE name <> 'a -- b  /* c */' AND name = :sport;"
+    assert db.compact_sql(question.sql) == question.sql
@@ -0,0 +1,144 @@
+"""
+Cache warm-up: replay hot routes so SQLite pages and app caches are hot.
+
+Routes come from warmup_routes.txt (one path per line, `#` comments), from
+the database (the detail pages of the athletes and Games with the most
+participations) and, when OLYMPICS_ACCESS_LOG points at a server log, from
+the most requested GET paths in it. They are replayed through the Flask
+test client in a small thread pool at server start and again whenever a new
+database version is picked up. A route shed by admission control (503) is
+retried after its Retry-After.
+"""
+import collections
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import db
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROUTES_FILE = os.path.join(BASE_DIR, "warmup_routes.txt")
+ACCESS_LOG = os.environ.get("OLYMPICS_ACCESS_LOG")
+CONCURRENCY = int(os.environ.get("OLYMPICS_WARMUP_CONCURRENCY", 4))
+TOP_LOGGED = 100
+TOP_DETAIL = int(os.environ.get("OLYMPICS_WARMUP_DETAIL", 50))
+RETRIES = 5            # a route shed by admission control (503) is tried again
+MAX_RETRY_WAIT = 8.0   # seconds, cap on the wait between tries
+
+# Detail page -> ids with the most participations first (LIMIT ?)
+DETAIL_SQL = {
+    "/athletes/{}/": """
+        SELECT athlete_id FROM PARTICIPATED_IN
+        GROUP BY athlete_id ORDER BY COUNT(*) DESC, athlete_id LIMIT ?;""",
+    "/olympics/{}/": """
+        SELECT e.olympics_id FROM PARTICIPATED_IN pi
+        JOIN EVENT e ON e.event_id = pi.event_id
+        GROUP BY e.olympics_id ORDER BY COUNT(*) DESC, e.olympics_id LIMIT ?;""",
+}
+
+# werkzeug access log: ... "GET /athletes/5/ HTTP/1.1" 200 -
+LOG_LINE_RE = re.compile(r'"GET (\S+) HTTP/[\d.]+" 200 ')
+
+LAST_REPORT = {}
+_lock = threading.Lock()
+
+
+def routes_from_file(path=ROUTES_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+
+def routes_from_log(path, top=TOP_LOGGED):
+    """The `top` most requested successful GET paths in an access log."""
+    counts = collections.Counter()
+    with open(path, errors="replace") as f:
+        for line in f:
+            match = LOG_LINE_RE.search(line)
+            if match and not match.group(1).startswith("/export/"):
+                counts[match.group(1)] += 1
+    return [path for path, _ in counts.most_common(top)]
+
+
+def routes_from_db(top=TOP_DETAIL):
+    """Detail pages of the `top` athletes and Games with the most participations."""
+    if top <= 0:
+        return []
+    try:
+        with closing(db.open_connection(db.DB.get("mode"))) as conn:
+            return [page.format(row[0]) for page, sql in DETAIL_SQL.items()
+                    for row in conn.execute(sql, (top,))]
+    except Exception:
+        logging.exception("Could not list detail pages to warm up")
+        return []
+
+
+def hot_routes():
+    """Configured routes first, then detail pages and logged ones, without duplicates."""
+    routes = routes_from_file() + routes_from_db()
+    if ACCESS_LOG and os.path.exists(ACCESS_LOG):
+        routes += routes_from_log(ACCESS_LOG)
+    return list(dict.fromkeys(routes))
+
+
+def warm(app, routes=None, concurrency=CONCURRENCY):
+    """
+    Request every route once with at most `concurrency` in flight.
+    Returns (and stores in LAST_REPORT) duration and coverage.
+    """
+    routes = hot_routes() if routes is None else routes
+    local = threading.local()
+
+    def fetch(path):
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        try:
+            for attempt in range(RETRIES + 1):
+                response = local.client.get(path)
+                if response.status_code != 503 or attempt == RETRIES:
+                    return response.status_code == 200
+                # Shed while the server is busy: wait as asked, backing off, and try again
+                wait = max(float(response.headers.get("Retry-After", 1)), 2 ** attempt)
+                time.sleep(min(wait, MAX_RETRY_WAIT))
+        except Exception:
+            logging.exception(f"Warm-up request failed: {path}")
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="warmup") as pool:
+        results = list(pool.map(fetch, routes))
+    report = {
+        "routes": len(routes),
+        "warmed": sum(results),
+        "failed": [path for path, ok in zip(routes, results) if not ok],
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    report["coverage"] = report["warmed"] / report["routes"] if routes else 1.0
+    LAST_REPORT.clear()
+    LAST_REPORT.update(report)
+    logging.info(
+        f"Warm-up: {report['warmed']}/{report['routes']} routes in {report['seconds']} s "
+        f"({report['coverage']:.0%} coverage)"
+    )
+    return report
+
+
+def start(app, routes=None):
+    """Run warm() in a background thread; concurrent calls are skipped."""
+    def run():
+        if not _lock.acquire(blocking=False):
+            return
+        try:
+            warm(app, routes)
+        finally:
+            _lock.release()
+
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
@@ -1,9 +1,36 @@
+import argparse
+import collections
+import glob
+import hashlib
+import inspect
+import json
+import os
+import shutil
 import sqlite3
+import sys
+import time
+
 import pandas as pd
 
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # the source cache falls back to pickle
+    pa = feather = None
+
 # File locations
 DB_FILE = "Olympics.db"
 EXCEL_FILE = "Olympics.xlsx"
+# Converted copy of the workbook, keyed by source_key(): <EXCEL_FILE>.cache-<key>.feather
+CACHE_SUFFIX = ".cache-"
+# Pointer file holding the published version, read by running servers
+VERSION_SUFFIX = ".version"
+# Each published version is its own file; DB_FILE is a hard link to the latest
+DATA_SUFFIX = ".data-"
+# Optional per-Games copy of EVENT / PARTICIPATED_IN, one folder per version
+SHARDS_SUFFIX = ".shards-"
+SHARD_BY = ("games", "decade")
+SHARDED_TABLES = ("EVENT", "PARTICIPATED_IN")
 
 # Column mapping from Excel to DB fields
 COLUMN_MAP = {
@@ -38,6 +65,12 @@ COLUMN_MAP = {
     "age": "Age",
     "medal": "Medal",
 }
+# Fields converted with to_int_safe / to_float_safe; the others with clean()
+INT_FIELDS = ("athlete_id", "team_id", "sport_id", "olympics_id", "event_id", "year", "age")
+FLOAT_FIELDS = ("height", "weight")
+
+# One normalized source row, with a field per COLUMN_MAP key
+SourceRow = collections.namedtuple("SourceRow", COLUMN_MAP)
 
 
 def clean(value):
@@ -84,6 +117,91 @@ def to_float_safe(value):
         return None
 
 
+def normalize_sheet(sheet):
+    """
+    Convert the raw sheet into {field: [value, ...]} for every COLUMN_MAP
+    field, with clean() / to_int_safe() / to_float_safe() already applied.
+    A column missing from the sheet becomes all None.
+    """
+    columns = {}
+    for field, source in COLUMN_MAP.items():
+        if source not in sheet.columns:
+            columns[field] = [None] * len(sheet)
+            continue
+        convert = to_int_safe if field in INT_FIELDS else to_float_safe if field in FLOAT_FIELDS else clean
+        columns[field] = [convert(value) for value in sheet[source].tolist()]
+    return columns
+
+
+def source_key(excel_path):
+    """
+    Hash of the workbook's content and of everything that shapes its
+    normalized form: the column mapping, the field types and the source
+    code of the conversion functions.
+    """
+    digest = hashlib.sha256()
+    with open(excel_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    digest.update(json.dumps([COLUMN_MAP, INT_FIELDS, FLOAT_FIELDS]).encode())
+    for function in (clean, to_int_safe, to_float_safe, normalize_sheet):
+        digest.update(inspect.getsource(function).encode())
+    return digest.hexdigest()[:16]
+
+
+def cache_path(excel_path, key):
+    return f"{excel_path}{CACHE_SUFFIX}{key}{'.feather' if feather else '.pickle'}"
+
+
+def write_source_cache(path, columns):
+    """
+    Store normalized columns as an uncompressed, typed Feather file (or a
+    pickle without pyarrow); the file appears atomically, fully written.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if feather:
+        types = {**{f: pa.int64() for f in INT_FIELDS}, **{f: pa.float64() for f in FLOAT_FIELDS}}
+        table = pa.table({f: pa.array(values, type=types.get(f, pa.string()))
+                          for f, values in columns.items()})
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+    else:
+        pd.to_pickle(columns, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_source_cache(path):
+    """Normalized columns from write_source_cache(), memory-mapping the Feather file."""
+    if feather:
+        table = feather.read_table(path, memory_map=True)
+        return {f: table.column(f).to_pylist() for f in table.column_names}
+    return pd.read_pickle(path)
+
+
+def prune_source_cache(excel_path, keep):
+    """Remove converted copies other than `keep`."""
+    for path in glob.glob(glob.escape(excel_path + CACHE_SUFFIX) + "*"):
+        if path != keep:
+            os.remove(path)
+
+
+def load_source(excel_path, use_cache=True):
+    """
+    The normalized source rows as a list of SourceRow. The workbook is only
+    parsed when no converted copy matches its source_key(); the converted
+    copy is then written for the next run.
+    """
+    path = cache_path(excel_path, source_key(excel_path)) if use_cache else None
+    if path and os.path.exists(path):
+        columns = read_source_cache(path)
+        print(f"Read {excel_path} from its converted copy {path}")
+    else:
+        columns = normalize_sheet(pd.read_excel(excel_path))
+        if path:
+            write_source_cache(path, columns)
+            prune_source_cache(excel_path, path)
+    return [SourceRow(*values) for values in zip(*(columns[f] for f in COLUMN_MAP))]
+
+
 def ensure_schema(cursor):
     """
     Create all database tables and indexes if they do not already exist.
@@ -141,6 +259,7 @@ def ensure_schema(cursor):
         event_id   INTEGER NOT NULL,
         age        INTEGER,
         medal      TEXT,
+        team_id    INTEGER REFERENCES TEAM(team_id),
         PRIMARY KEY (athlete_id, event_id),
         FOREIGN KEY (athlete_id) REFERENCES ATHLETE(athlete_id),
         FOREIGN KEY (event_id)   REFERENCES EVENT(event_id)
@@ -150,10 +269,44 @@ def ensure_schema(cursor):
     CREATE INDEX IF NOT EXISTS idx_event_olympics ON EVENT(olympics_id);
     CREATE INDEX IF NOT EXISTS idx_it_team        ON IN_THE_TEAM(team_id);
     CREATE INDEX IF NOT EXISTS idx_pi_event       ON PARTICIPATED_IN(event_id);
+    CREATE INDEX IF NOT EXISTS idx_pi_team        ON PARTICIPATED_IN(team_id, medal);
     """
     cursor.executescript(schema)
 
 
+def add_team_column(cursor):
+    """
+    Migrate a database built before PARTICIPATED_IN.team_id existed.
+
+    The source rows are gone, so the team can only be filled in where it is
+    unambiguous (athletes with exactly one team). Returns the number of
+    participations of athletes with several teams, whose team is unknown:
+    the migration must not be published when it is not 0, as questions and
+    team pages grouping on team_id would silently undercount.
+    """
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(PARTICIPATED_IN);")]
+    if "team_id" not in columns:
+        cursor.execute(
+            "ALTER TABLE PARTICIPATED_IN ADD COLUMN team_id INTEGER REFERENCES TEAM(team_id);")
+        cursor.execute(
+            """
+            UPDATE PARTICIPATED_IN
+            SET team_id = (SELECT MIN(it.team_id) FROM IN_THE_TEAM it
+                           WHERE it.athlete_id = PARTICIPATED_IN.athlete_id)
+            WHERE athlete_id IN (SELECT athlete_id FROM IN_THE_TEAM
+                                 GROUP BY athlete_id HAVING COUNT(*) = 1)
+            """
+        )
+    ensure_schema(cursor)
+    # Athletes without any team have no team_id after an import either
+    return cursor.execute(
+        """
+        SELECT COUNT(*) FROM PARTICIPATED_IN
+        WHERE team_id IS NULL
+          AND athlete_id IN (SELECT athlete_id FROM IN_THE_TEAM)
+        """).fetchone()[0]
+
+
 def make_id_resolver(cursor, table, pk_column, unique_columns):
     """
     Create a resolver function for a table primary key.
@@ -210,132 +363,360 @@ def make_id_resolver(cursor, table, pk_column, unique_columns):
     return resolve
 
 
-# ---------- Data import ----------
-sheet = pd.read_excel(EXCEL_FILE)
-
-connection = sqlite3.connect(DB_FILE)
-cursor = connection.cursor()
-cursor.execute("PRAGMA foreign_keys = ON;")
-
-ensure_schema(cursor)
-connection.commit()
-
-team_pk     = make_id_resolver(cursor, "TEAM", "team_id", ["name", "noc"])
-sport_pk    = make_id_resolver(cursor, "SPORT", "sport_id", ["name"])
-olympics_pk = make_id_resolver(
-    cursor, "OLYMPICS", "olympics_id", ["year", "season", "city", "name"]
-)
-event_pk    = make_id_resolver(
-    cursor, "EVENT", "event_id", ["name", "sport_id", "olympics_id"]
-)
-athlete_pk  = make_id_resolver(
-    cursor, "ATHLETE", "athlete_id", ["name", "sex"]
-)
-
-for _, row in sheet.iterrows():
-    # ATHLETE
-    athlete_id = to_int_safe(row.get(COLUMN_MAP["athlete_id"])) if COLUMN_MAP.get("athlete_id") in sheet.columns else None
-    athlete_name = clean(row.get(COLUMN_MAP["athlete_name"]))
-    gender = clean(row.get(COLUMN_MAP["sex"]))
-    height_val = to_float_safe(row.get(COLUMN_MAP["height"])) if COLUMN_MAP.get("height") in sheet.columns else None
-    weight_val = to_float_safe(row.get(COLUMN_MAP["weight"])) if COLUMN_MAP.get("weight") in sheet.columns else None
-
-    if athlete_id is None:
-        athlete_id = athlete_pk(athlete_name, gender)
-
-    if athlete_id is not None:
-        cursor.execute(
-            """
-            INSERT OR IGNORE INTO ATHLETE(athlete_id, name, sex, height, weight)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (athlete_id, athlete_name, gender, height_val, weight_val),
-        )
-
-    # TEAM
-    team_id = to_int_safe(row.get(COLUMN_MAP["team_id"])) if COLUMN_MAP.get("team_id") in sheet.columns else None
-    team_name = clean(row.get(COLUMN_MAP["team_name"]))
-    noc_val = clean(row.get(COLUMN_MAP["noc"]))
-
-    if team_id is None:
-        team_id = team_pk(team_name, noc_val)
-
-    if team_id is not None:
-        cursor.execute(
-            """
-            INSERT OR IGNORE INTO TEAM(team_id, name, noc)
-            VALUES (?, ?, ?)
-            """,
-            (team_id, team_name, noc_val),
-        )
+def import_sheet(cursor, rows):
+    """
+    Insert every normalized source row (see load_source) into the schema.
 
-    if athlete_id is not None and team_id is not None:
-        cursor.execute(
-            "INSERT OR IGNORE INTO IN_THE_TEAM(athlete_id, team_id) VALUES (?, ?)",
-            (athlete_id, team_id),
-        )
+    Missing surrogate keys are resolved (or generated) through
+    make_id_resolver, so the import is idempotent for a given sheet.
+    """
+    team_pk     = make_id_resolver(cursor, "TEAM", "team_id", ["name", "noc"])
+    sport_pk    = make_id_resolver(cursor, "SPORT", "sport_id", ["name"])
+    olympics_pk = make_id_resolver(
+        cursor, "OLYMPICS", "olympics_id", ["year", "season", "city", "name"]
+    )
+    event_pk    = make_id_resolver(
+        cursor, "EVENT", "event_id", ["name", "sport_id", "olympics_id"]
+    )
+    athlete_pk  = make_id_resolver(
+        cursor, "ATHLETE", "athlete_id", ["name", "sex"]
+    )
+
+    for row in rows:
+        # ATHLETE
+        athlete_id = row.athlete_id
+        athlete_name = row.athlete_name
+        gender = row.sex
+        height_val = row.height
+        weight_val = row.weight
+
+        if athlete_id is None:
+            athlete_id = athlete_pk(athlete_name, gender)
+
+        if athlete_id is not None:
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO ATHLETE(athlete_id, name, sex, height, weight)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (athlete_id, athlete_name, gender, height_val, weight_val),
+            )
+
+        # TEAM
+        team_id = row.team_id
+        team_name = row.team_name
+        noc_val = row.noc
+
+        if team_id is None:
+            team_id = team_pk(team_name, noc_val)
+
+        if team_id is not None:
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO TEAM(team_id, name, noc)
+                VALUES (?, ?, ?)
+                """,
+                (team_id, team_name, noc_val),
+            )
+
+        if athlete_id is not None and team_id is not None:
+            cursor.execute(
+                "INSERT OR IGNORE INTO IN_THE_TEAM(athlete_id, team_id) VALUES (?, ?)",
+                (athlete_id, team_id),
+            )
+
+        # SPORT
+        sport_id = row.sport_id
+        sport_name = row.sport_name
+
+        if sport_id is None:
+            sport_id = sport_pk(sport_name)
+
+        if sport_id is not None:
+            cursor.execute(
+                "INSERT OR IGNORE INTO SPORT(sport_id, name) VALUES (?, ?)",
+                (sport_id, sport_name),
+            )
+
+        # OLYMPICS
+        olympics_id = row.olympics_id
+        olympics_name = row.olympics_name
+        year_val = row.year
+        season_val = row.season
+        city_val = row.city
+
+        if olympics_id is None:
+            olympics_id = olympics_pk(year_val, season_val, city_val, olympics_name)
+
+        if olympics_id is not None:
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO OLYMPICS(olympics_id, name, year, season, city)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (olympics_id, olympics_name, year_val, season_val, city_val),
+            )
+
+        # EVENT
+        event_id = row.event_id
+        event_name = row.event_name
+
+        if event_id is None:
+            event_id = event_pk(event_name, sport_id, olympics_id)
+
+        if event_id is not None and sport_id is not None and olympics_id is not None:
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO EVENT(event_id, name, sport_id, olympics_id)
+                VALUES (?, ?, ?, ?)
+                """,
+                (event_id, event_name, sport_id, olympics_id),
+            )
+
+        # PARTICIPATED_IN
+        age_val = row.age
+        medal_val = row.medal
+
+        if athlete_id is not None and event_id is not None:
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO PARTICIPATED_IN(athlete_id, event_id, age, medal, team_id)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (athlete_id, event_id, age_val, medal_val, team_id),
+            )
+
+
+def validate(path):
+    """
+    Check a freshly built database before it is published.
 
-    # SPORT
-    sport_id = to_int_safe(row.get(COLUMN_MAP["sport_id"])) if COLUMN_MAP.get("sport_id") in sheet.columns else None
-    sport_name = clean(row.get(COLUMN_MAP["sport_name"]))
+    Raises RuntimeError if SQLite reports corruption, dangling foreign
+    keys, or if one of the core tables ended up empty.
+    """
+    connection = sqlite3.connect(path)
+    try:
+        status = connection.execute("PRAGMA integrity_check;").fetchone()[0]
+        if status != "ok":
+            raise RuntimeError(f"integrity_check failed: {status}")
+        dangling = connection.execute("PRAGMA foreign_key_check;").fetchall()
+        if dangling:
+            raise RuntimeError(f"{len(dangling)} rows violate foreign keys")
+        for table in ("ATHLETE", "TEAM", "SPORT", "OLYMPICS", "EVENT", "PARTICIPATED_IN"):
+            if connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0:
+                raise RuntimeError(f"table {table} is empty")
+    finally:
+        connection.close()
+
+
+def write_atomic(path, text):
+    """Replace `path` with `text` so readers see either the old or new content."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def prime_page_cache(path, chunk=1 << 20):
+    """
+    Read the file once so its pages are in the OS page cache before servers
+    switch to it; the servers then replay their hot routes (warmup.py).
+    """
+    with open(path, "rb") as f:
+        while f.read(chunk):
+            pass
 
-    if sport_id is None:
-        sport_id = sport_pk(sport_name)
 
-    if sport_id is not None:
-        cursor.execute(
-            "INSERT OR IGNORE INTO SPORT(sport_id, name) VALUES (?, ?)",
-            (sport_id, sport_name),
-        )
+def shard_name(by, olympics_id, year):
+    if by == "decade":
+        return f"decade_{year // 10 * 10 if year is not None else 'unknown'}"
+    return f"games_{olympics_id:05d}"
 
-    # OLYMPICS
-    olympics_id = to_int_safe(row.get(COLUMN_MAP["olympics_id"])) if COLUMN_MAP.get("olympics_id") in sheet.columns else None
-    olympics_name = clean(row.get(COLUMN_MAP["olympics_name"]))
-    year_val = to_int_safe(row.get(COLUMN_MAP["year"]))
-    season_val = clean(row.get(COLUMN_MAP["season"]))
-    city_val = clean(row.get(COLUMN_MAP["city"]))
 
-    if olympics_id is None:
-        olympics_id = olympics_pk(year_val, season_val, city_val, olympics_name)
+def write_shards(db_path, folder, by="games"):
+    """
+    Split EVENT and PARTICIPATED_IN of `db_path` into one SQLite file per
+    Games (or decade) under `folder`, plus a manifest.json mapping each file
+    to its olympics_ids. The folder appears atomically, fully written.
+    """
+    groups = {}
+    source = sqlite3.connect(db_path)
+    try:
+        for olympics_id, year in source.execute(
+                "SELECT olympics_id, year FROM OLYMPICS ORDER BY year, olympics_id;"):
+            groups.setdefault(shard_name(by, olympics_id, year), []).append(olympics_id)
+        # Tables first, then their indexes
+        ddl = [sql for (sql,) in source.execute(
+            f"SELECT sql FROM sqlite_master WHERE tbl_name IN {SHARDED_TABLES} "
+            "AND sql IS NOT NULL ORDER BY type = 'index';")]
+    finally:
+        source.close()
+
+    tmp_folder = f"{folder}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    shards = []
+    for name, olympics_ids in groups.items():
+        path = os.path.join(tmp_folder, f"{name}.db")
+        connection = sqlite3.connect(path)
+        connection.execute("ATTACH DATABASE ? AS src;", (db_path,))
+        for sql in ddl:
+            connection.execute(sql)
+        ids = ", ".join(str(i) for i in olympics_ids)
+        connection.execute(f"INSERT INTO main.EVENT SELECT * FROM src.EVENT WHERE olympics_id IN ({ids});")
+        connection.execute(
+            "INSERT INTO main.PARTICIPATED_IN SELECT pi.* FROM src.PARTICIPATED_IN pi "
+            "JOIN main.EVENT e ON e.event_id = pi.event_id;")
+        rows = connection.execute("SELECT COUNT(*) FROM main.PARTICIPATED_IN;").fetchone()[0]
+        connection.commit()
+        connection.execute("DETACH DATABASE src;")
+        connection.execute("VACUUM;")
+        connection.close()
+        shards.append({"file": f"{name}.db", "olympics_ids": olympics_ids, "participations": rows})
+
+    write_atomic(os.path.join(tmp_folder, "manifest.json"),
+                 json.dumps({"by": by, "shards": shards}, indent=1) + "\n")
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp_folder, folder)
+    return shards
+
+
+def prune_versions(db_path, keep):
+    """Remove the data files and shard folders of versions other than those in `keep`."""
+    for suffix in (DATA_SUFFIX, SHARDS_SUFFIX):
+        for path in glob.glob(glob.escape(db_path + suffix) + "*"):
+            if path[len(db_path + suffix):] not in keep:
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+
+
+def read_version(db_path):
+    try:
+        with open(db_path + VERSION_SUFFIX) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
 
-    if olympics_id is not None:
-        cursor.execute(
-            """
-            INSERT OR IGNORE INTO OLYMPICS(olympics_id, name, year, season, city)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (olympics_id, olympics_name, year_val, season_val, city_val),
-        )
 
-    # EVENT
-    event_id = to_int_safe(row.get(COLUMN_MAP["event_id"])) if COLUMN_MAP.get("event_id") in sheet.columns else None
-    event_name = clean(row.get(COLUMN_MAP["event_name"]))
+def link_atomic(source, path):
+    """Make `path` a hard link to `source`, replacing whatever was there."""
+    if os.path.exists(path) and os.path.samefile(source, path):
+        return
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    os.link(source, tmp_path)
+    os.replace(tmp_path, path)
 
-    if event_id is None:
-        event_id = event_pk(event_name, sport_id, olympics_id)
 
-    if event_id is not None and sport_id is not None and olympics_id is not None:
-        cursor.execute(
-            """
-            INSERT OR IGNORE INTO EVENT(event_id, name, sport_id, olympics_id)
-            VALUES (?, ?, ?, ?)
-            """,
-            (event_id, event_name, sport_id, olympics_id),
-        )
+def publish(build_path, db_path, version=None, previous=None):
+    """
+    Publish a validated build as a new version and flip the version pointer.
+
+    The build becomes <db_path>.data-<version>, and servers open the data file
+    the pointer names, so the pointer is the only thing that changes for them:
+    until it flips they keep reading the previous file, whose caches and
+    shards match it. `db_path` is then relinked to the new file for tools that
+    open it directly. A `previous` version published before data files
+    existed gets one first, so servers still on it do not read the new file.
+    """
+    with open(build_path, "rb") as f:
+        os.fsync(f.fileno())
+    version = version or str(time.time_ns())
+    if previous and os.path.exists(db_path) and not os.path.exists(db_path + DATA_SUFFIX + previous):
+        link_atomic(db_path, db_path + DATA_SUFFIX + previous)
+    os.replace(build_path, db_path + DATA_SUFFIX + version)
+    write_atomic(db_path + VERSION_SUFFIX, version + "\n")
+    link_atomic(db_path + DATA_SUFFIX + version, db_path)
+    return version
 
-    # PARTICIPATED_IN
-    age_val = to_int_safe(row.get(COLUMN_MAP["age"])) if COLUMN_MAP.get("age") in sheet.columns else None
-    medal_val = clean(row.get(COLUMN_MAP["medal"])) if COLUMN_MAP.get("medal") in sheet.columns else None
 
-    if athlete_id is not None and event_id is not None:
-        cursor.execute(
-            """
-            INSERT OR IGNORE INTO PARTICIPATED_IN(athlete_id, event_id, age, medal)
-            VALUES (?, ?, ?, ?)
-            """,
-            (athlete_id, event_id, age_val, medal_val),
-        )
+# ---------- Data import ----------
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import Olympics.xlsx into Olympics.db.")
+    parser.add_argument("--db", default=DB_FILE, help=f"database to publish (default: {DB_FILE})")
+    parser.add_argument("--shard-by", choices=SHARD_BY, default=os.environ.get("OLYMPICS_SHARD_BY"),
+                        help="also write EVENT/PARTICIPATED_IN shards per Games or decade")
+    parser.add_argument("--shards-only", action="store_true",
+                        help="only (re)write the shards of the published database")
+    parser.add_argument("--migrate", action="store_true",
+                        help="upgrade the published database to the current schema instead of importing")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"parse {EXCEL_FILE} even if a converted copy exists, and do not write one")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    db_path = args.db
+    previous = read_version(db_path)
+
+    if args.shards_only:
+        # New version for the same file, so running servers pick the shards up
+        version = str(time.time_ns())
+        shards = write_shards(db_path, db_path + SHARDS_SUFFIX + version, args.shard_by or "games")
+        # The same file under the new version: one more hard link, no copy
+        build_path = f"{db_path}.build-{os.getpid()}"
+        link_atomic(db_path, build_path)
+        publish(build_path, db_path, version, previous)
+        prune_versions(db_path, {version, previous})
+        print(f"Wrote {len(shards)} shards for {db_path} (version {version})")
+        return
+
+    # Build next to the live file (same filesystem, so the final rename is atomic)
+    build_path = f"{db_path}.build-{os.getpid()}"
+    if os.path.exists(build_path):
+        os.remove(build_path)
+
+    connection = sqlite3.connect(build_path)
+    cursor = connection.cursor()
+
+    if args.migrate:
+        source = sqlite3.connect(db_path)
+        source.backup(connection)
+        source.close()
+        ambiguous = add_team_column(cursor)
+        if ambiguous:
+            connection.close()
+            os.remove(build_path)
+            sys.exit(
+                f"Migration aborted, {db_path} left untouched: {ambiguous} participations belong to "
+                f"athletes with several teams and cannot be given a team_id without the source rows. "
+                f"Re-import from {EXCEL_FILE} instead.")
+    else:
+        rows = load_source(EXCEL_FILE, use_cache=not args.no_cache)
+        cursor.execute("PRAGMA foreign_keys = ON;")
+
+        ensure_schema(cursor)
+        connection.commit()
+
+        import_sheet(cursor, rows)
+
+    connection.commit()
+    connection.close()
 
-connection.commit()
-connection.close()
-print("Import into Olympics.db completed successfully!")
+    try:
+        validate(build_path)
+    except RuntimeError as exc:
+        os.remove(build_path)
+        sys.exit(f"Import failed validation, {db_path} left untouched: {exc}")
+
+    version = str(time.time_ns())
+    if args.shard_by:
+        # Written before the pointer flips, so servers find them with the new version
+        shards = write_shards(build_path, db_path + SHARDS_SUFFIX + version, args.shard_by)
+        print(f"Wrote {len(shards)} shards by {args.shard_by}")
+
+    prime_page_cache(build_path)
+    publish(build_path, db_path, version, previous)
+    # Servers still on the previous version keep its file and shards until they swap
+    prune_versions(db_path, {version, previous})
+    print(f"{'Migration' if args.migrate else 'Import'} into {db_path} completed successfully! (version {version})")
+
+
+if __name__ == "__main__":
+    main()